@@ -0,0 +1,10 @@
+import logging
+import os
+
+# config пишет лог в tmp/ относительно рабочей директории
+os.makedirs('tmp', exist_ok=True)
+
+
+def quiet_logging(level: int = logging.WARNING):
+    # логирование не должно попадать в замеры
+    logging.getLogger("rinex_data_quality_logger").setLevel(level)
@@ -0,0 +1,52 @@
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import quiet_logging
+from benchmarks.synthetic import write_satellite_day
+from functions import find_satellite_holes
+from holes_cache import holes_cache
+
+
+def run(files: list, workers: int, data_period: int, timestep: float):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # прогрев: запуск процессов и импорт модулей не входит в замер
+        list(pool.map(find_satellite_holes, files[:workers], [data_period] * workers, [timestep] * workers))
+
+        # первый проход считает вклады строк заново, второй берет их из кэша
+        for file in files:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(holes_cache.get_path(file))
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            list(pool.map(find_satellite_holes, files, [data_period] * len(files), [timestep] * len(files)))
+            timings.append(time.perf_counter() - start)
+        return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling of per-satellite hole detection over a process pool")
+    parser.add_argument('--satellites', type=int, default=100)
+    parser.add_argument('--timestep', type=float, default=30)
+    parser.add_argument('--data-period', type=int, default=15)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with tempfile.TemporaryDirectory() as folder:
+        files = write_satellite_day(folder, satellites=args.satellites, timestep=args.timestep)
+
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>10} {'sat/s':>10} {'speedup':>8} {'cached s':>10}")
+        for workers in range(1, args.max_workers + 1):
+            elapsed, cached = run(files, workers, args.data_period, args.timestep)
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>10.3f} {len(files) / elapsed:>10.1f} {baseline / elapsed:>8.2f} {cached:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
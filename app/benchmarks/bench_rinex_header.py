@@ -0,0 +1,78 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from benchmarks import quiet_logging
+from benchmarks.synthetic import rinex_header
+from parsers.rinex_parser import RinexParser
+
+
+def legacy_scan(path: str):
+    # регулярные выражения по каждой строке, как было до разбора по меткам
+    timestep = radar_coords = radar_name = first_date = None
+    systems = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line[0] == ">":
+                break
+            if timestep is None:
+                timestep_match = re.search(r"(\d+\.\d+)\s+INTERVAL", line)
+                if timestep_match:
+                    timestep = float(timestep_match.group(1).strip())
+            if radar_coords is None:
+                radar_coords_match = re.findall(r"(.*)\s+APPROX POSITION XYZ", line)
+                if radar_coords_match:
+                    splited = radar_coords_match[0].split()
+                    radar_coords = (float(splited[0]), float(splited[1]), float(splited[2]))
+            if radar_name is None:
+                radar_name_match = re.search(r"(.*)\s+MARKER NAME", line)
+                if radar_name_match:
+                    radar_name = radar_name_match.group(1).strip()
+            systems_match = re.findall(r"(.*)\s+SYS / # / OBS TYPES ", line)
+            if systems_match:
+                splited = systems_match[0].split()
+                systems[f"{splited[0]}_signals".lower()] = splited[2:]
+            if first_date is None:
+                date_match = re.findall(r"(.*)\s+TIME OF FIRST OBS", line)
+                if date_match:
+                    first_date = date_match[0].split()[:3]
+    return systems
+
+
+def scan(path: str):
+    parser = RinexParser.__new__(RinexParser)
+    parser.file = path
+    parser.timestep = parser.radar_coords = parser.radar_name = parser.date = None
+    parser.systems = {}
+    with open(path, 'r') as f:
+        parser.scan_header(f)
+    return parser.systems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RINEX header scan against the legacy regex scanner")
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--epochs', type=int, default=2000, help="observation lines after the header")
+    args = parser.parse_args()
+    quiet_logging()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'test.rnx')
+        with open(path, 'w') as f:
+            f.write(rinex_header())
+            f.write("> 2024 01 02 00 00  0.0000000  0  1\n")
+            f.write("G01  20000000.000 7 105000000.000 7\n" * args.epochs)
+
+        print(f"{'scanner':>10} {'us/file':>10}")
+        for name, function in (('legacy', legacy_scan), ('labels', scan)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                function(path)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>10} {elapsed / args.repeat * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import quiet_logging
+from benchmarks.synthetic import DEFAULT_SIGNALS, satellite_rows, write_satellite_file
+from parsers.satellite_parser import SatelliteParser
+
+
+def legacy_load(path: str):
+    # построчный разбор в списки строк, как было до колоночного загрузчика
+    data = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line[0] == '#':
+                line.split()
+            else:
+                data.append(line.split())
+    return np.array(data[1:]).astype(float)
+
+
+def measure(function, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    
+    # tracemalloc замедляет выполнение, поэтому память меряется отдельным запуском
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SatelliteParser loader against the legacy line-by-line path")
+    parser.add_argument('--timestep', type=float, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    quiet_logging()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'test_G01.dat')
+        data = satellite_rows(np.random.default_rng(0), timestep=args.timestep)
+        write_satellite_file(path, 'test', 'G01', data, DEFAULT_SIGNALS)
+        print(f"{len(data)} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+
+        cases = {
+            'legacy': lambda: legacy_load(path),
+            'float64': lambda: SatelliteParser.load(path),
+            'float32': lambda: SatelliteParser.load(path, dtype=np.float32),
+        }
+        print(f"{'loader':>10} {'seconds':>10} {'peak MB':>10}")
+        for name, function in cases.items():
+            elapsed, peak = measure(function, args.repeat)
+            print(f"{name:>10} {elapsed:>10.3f} {peak / 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
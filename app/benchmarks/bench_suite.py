@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from fastapi import UploadFile
+
+from benchmarks import quiet_logging
+from benchmarks.synthetic import DEFAULT_SIGNALS, write_rinex_file, write_satellite_day
+from functions import convert_numpy_to_list, find_holes, find_satellite_holes
+from holes_cache import holes_cache
+from parsers.rinex_parser import RinexParser
+from parsers.satellite_parser import SatelliteParser
+
+# Горячие пути разбора и поиска дыр на синтетических сутках. Каждый случай
+# выполняется в отдельном процессе, чтобы пиковая память не зависела от соседних.
+# Случаям find_holes_in_data нужен доступный Redis (REDIS_HOST), без него они пропускаются,
+# приложение импортируется только в них.
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+# Параметры данных, при расхождении которых сравнение с базой не имеет смысла
+DATA_OPTIONS = ('timestep', 'satellites', 'signals', 'arcs', 'gap_rate', 'gap_length', 'data_period', 'compress')
+
+
+def measure(function, repeat: int, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def clear_sidecars(folder: str):
+    # кэши разбора и дыр лежат рядом с файлами спутников, без них замер холодный
+    for path in Path(folder).iterdir():
+        if path.suffix != '.dat':
+            path.unlink()
+
+
+def bench_rinex_process(data: dict, args):
+    async def process():
+        with open(data['rinex'], 'rb') as f:
+            await RinexParser.create(UploadFile(f, filename=os.path.basename(data['rinex'])))
+
+    seconds = measure(lambda: asyncio.run(process()), args.repeat)
+    return seconds, os.path.getsize(data['rinex']) / 1e6, 'MB'
+
+
+def bench_satellite_parse(data: dict, args):
+    async def process():
+        return [await SatelliteParser.create(file) for file in data['satellites']]
+
+    seconds = measure(lambda: asyncio.run(process()), args.repeat, lambda: clear_sidecars(data['folder']))
+    return seconds, data['rows'], 'rows'
+
+
+def bench_find_holes(data: dict, args):
+    # вклады строк считаются заново при каждом повторе
+    holes_cache.enabled = False
+    satellites = [SatelliteParser.load(file) for file in data['satellites']]
+    seconds = measure(
+        lambda: [find_holes(satellite, args.data_period, args.timestep) for satellite in satellites],
+        args.repeat,
+    )
+    return seconds, data['rows'], 'rows'
+
+
+def bench_convert_numpy_to_list(data: dict, args):
+    result = [find_satellite_holes(file, args.data_period, args.timestep)[0] for file in data['satellites']]
+    values = sum(len(signal['y']) for satellite in result for signal in satellite['data'])
+    seconds = measure(lambda: convert_numpy_to_list(result), args.repeat)
+    return seconds, values, 'values'
+
+
+async def request_holes(data: dict, args, cached: bool):
+    import httpx
+    import redis
+    from config import redis_async_client, redis_client
+    from main import app, lifespan
+    from parsers.parser_manager import get_parser_manager
+    from task_store import task_store, TaskStatus
+
+    try:
+        await redis_async_client.ping()
+    except redis.RedisError as e:
+        print(f"Redis is not available: {e}", file=sys.stderr)
+        return None
+
+    # задача с готовыми файлами спутников, как после конвертации
+    task_id = f"bench-{uuid.uuid4()}"
+    try:
+        manager = await get_parser_manager()
+        with open(data['rinex'], 'rb') as f:
+            await manager.set_parser(task_id, UploadFile(f, filename=os.path.basename(data['rinex'])))
+        await task_store.create(task_id)
+        await task_store.update(task_id, TaskStatus.COMPLETED, files=data['satellites'])
+
+        async with lifespan(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+                async def request():
+                    response = await client.post(
+                        '/find_holes_in_data', data={'task_id': task_id, 'data_period': args.data_period}
+                    )
+                    response.raise_for_status()
+
+                # прогрев: запуск процессов пула не входит в замер
+                await request()
+                timings = []
+                for _ in range(args.repeat):
+                    if not cached:
+                        clear_sidecars(data['folder'])
+                    start = time.perf_counter()
+                    await request()
+                    timings.append(time.perf_counter() - start)
+    finally:
+        # записи задачи и парсера не остаются в Redis после замера, клиент
+        # синхронный: асинхронный закрывается вместе с приложением
+        try:
+            redis_client.delete(task_store.get_key(task_id), f"parser:{task_id}")
+        except redis.RedisError as e:
+            print(f"Failed to remove benchmark task {task_id}: {e}", file=sys.stderr)
+    return min(timings), len(data['satellites']), 'sat'
+
+
+def bench_find_holes_in_data(data: dict, args):
+    return asyncio.run(request_holes(data, args, cached=False))
+
+
+def bench_find_holes_in_data_cached(data: dict, args):
+    return asyncio.run(request_holes(data, args, cached=True))
+
+
+CASES = {
+    'rinex_process': bench_rinex_process,
+    'satellite_parse': bench_satellite_parse,
+    'find_holes': bench_find_holes,
+    'convert_numpy_to_list': bench_convert_numpy_to_list,
+    'find_holes_in_data': bench_find_holes_in_data,
+    'find_holes_in_data_cached': bench_find_holes_in_data_cached,
+}
+
+
+def get_peak_rss() -> int:
+    # ru_maxrss сохраняется при exec и у процесса spawn включает память родителя
+    # на момент запуска, VmHWM считается заново
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_case(name: str, data: dict, args):
+    # процесс случая запущен через spawn и наследует этот способ, а пул приложения
+    # должен создавать процессы так же, как в сервисе
+    multiprocessing.set_start_method(None, force=True)
+    quiet_logging()
+    result = CASES[name](data, args)
+    if result is None:
+        return None
+
+    seconds, amount, unit = result
+    # в килобайтах, процессы пула учитываются после их завершения
+    peak = max(get_peak_rss(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {'seconds': seconds, 'amount': amount, 'unit': unit, 'peak_rss_mb': peak / 1024}
+
+
+def generate(folder: str, args):
+    satellites = os.path.join(folder, 'satellites')
+    files = write_satellite_day(
+        satellites,
+        satellites=args.satellites,
+        timestep=args.timestep,
+        signals_count=args.signals,
+        arcs=args.arcs,
+        gap_rate=args.gap_rate,
+        gap_length=args.gap_length,
+    )
+    rinex = os.path.join(folder, 'test0020.24o.gz' if args.compress else 'test0020.24o')
+    write_rinex_file(
+        rinex,
+        satellites=args.satellites,
+        interval=args.timestep,
+        compress=args.compress,
+        arcs=args.arcs,
+        gap_rate=args.gap_rate,
+        gap_length=args.gap_length,
+    )
+    # строки данных без четырех строк заголовка
+    rows = 0
+    for file in files:
+        with open(file, 'rb') as f:
+            rows += sum(1 for _ in f) - 4
+    return {'folder': satellites, 'satellites': files, 'rinex': rinex, 'rows': rows}
+
+
+def compare(name: str, result: dict, baseline: dict, threshold: float):
+    reference = baseline['results'].get(name)
+    if reference is None:
+        return '', False
+    ratio = result['seconds'] / reference['seconds']
+    slower = ratio > 1 + threshold
+    return f"{ratio:>8.2f}x{' slower' if slower else ''}", slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parsing and hole detection hot paths on synthetic data")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--timestep', type=float, default=30, help="observation interval, seconds")
+    parser.add_argument('--satellites', type=int, default=100)
+    parser.add_argument('--signals', type=int, default=len(DEFAULT_SIGNALS), help="signals in satellite files")
+    parser.add_argument('--arcs', type=int, default=2, help="passes over the horizon per day")
+    parser.add_argument('--gap-rate', type=float, default=0.002, help="share of missing epochs")
+    parser.add_argument('--gap-length', type=int, default=1, help="epochs in a row per gap")
+    parser.add_argument('--data-period', type=int, default=15)
+    parser.add_argument('--compress', action='store_true', help="gzip the RINEX upload")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', nargs='?', const=BASELINE_PATH, type=Path, help="compare with a saved run")
+    parser.add_argument('--save-baseline', nargs='?', const=BASELINE_PATH, type=Path)
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+    quiet_logging()
+
+    options = {option: getattr(args, option) for option in DATA_OPTIONS}
+    baseline = None
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline['options'] != options:
+            print(f"Baseline was recorded with other options: {baseline['options']}")
+
+    results = {}
+    regressions = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # файлы загрузок и лог пишутся относительно рабочей директории
+        os.chdir(folder)
+        try:
+            data = generate(folder, args)
+            print(
+                f"{len(data['satellites'])} satellites, {data['rows']} rows, "
+                f"RINEX {os.path.getsize(data['rinex']) / 1e6:.1f} MB"
+            )
+            print(f"{'case':>26} {'seconds':>10} {'throughput':>20} {'peak RSS MB':>12} {'baseline':>9}")
+            for name in args.cases:
+                # новый процесс на случай: пиковая память и кэши модулей не переходят между случаями
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    result = pool.submit(run_case, name, data, args).result()
+                if result is None:
+                    print(f"{name:>26} {'skipped':>10}")
+                    continue
+
+                results[name] = result
+                throughput = f"{result['amount'] / result['seconds']:.1f} {result['unit']}/s"
+                line = f"{name:>26} {result['seconds']:>10.3f} {throughput:>20} {result['peak_rss_mb']:>12.1f}"
+                if baseline is not None:
+                    comparison, slower = compare(name, result, baseline, args.threshold)
+                    line += f" {comparison}"
+                    if slower:
+                        regressions.append(name)
+                print(line)
+        finally:
+            os.chdir(cwd)
+
+    if args.save_baseline is not None:
+        args.save_baseline.write_text(json.dumps({'options': options, 'results': results}, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+    if regressions:
+        print(f"Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+from starlette.concurrency import run_in_threadpool
+
+from benchmarks import quiet_logging
+from benchmarks.synthetic import rinex_header
+
+# Сквозная задержка download_sattelite_files против локальной заглушки сервиса.
+# Нужен доступный Redis (REDIS_HOST), статусы задач пишутся в него.
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub(port: int):
+    from benchmarks.stub_upstream import app, build_result_archive
+    # архив результата собирается заранее, чтобы не попасть в замер
+    app.state.result = build_result_archive()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def write_rinex(folder: str, day: int, epochs: int):
+    path = os.path.join(folder, f'test{day:03d}.rnx')
+    with open(path, 'w') as f:
+        f.write(rinex_header(month=1, day=day))
+        f.write("> 2024 01 02 00 00  0.0000000  0  1\n")
+        f.write("G01  20000000.000 7 105000000.000 7\n" * epochs)
+    return path
+
+
+def make_parser(path: str, day: int):
+    from parsers.rinex_parser import RinexParser
+    from benchmarks.synthetic import RINEX_SYSTEMS
+    return RinexParser.from_metadata({
+        'file': path,
+        'filename': os.path.basename(path),
+        'timestep': 30.0,
+        'radar_coords': None,
+        'radar_name': 'TEST',
+        'date': f'2024-01-{day:02d}',
+        'systems': {f"{system.lower()}_signals": types for system, types in RINEX_SYSTEMS.items()},
+    })
+
+
+def legacy_pipeline(parser, task_id: str):
+    # последовательные блокирующие запросы без таймаутов, каждый на новом соединении, как было до пула
+    from functions import unzip_gz
+    from config import FILE_BASE_PATH, NAV_FILES_URL, UPLOAD_NAV_URL, UPLOAD_RINEX_URL, RUN_URL, RESULT_URL
+
+    date = parser.get_date()
+    year = date.year
+    yday = str(date.timetuple().tm_yday).zfill(3)
+    nav_filename = f'BRDC00IGS_R_{year}{yday}0000_01D_MN.rnx.gz'
+    cookies = {"rinex_to_csv_processing_id": f"{parser.get_filename()}-_-{nav_filename}"}
+
+    folder = os.path.join(FILE_BASE_PATH, 'downloaded_files', f"{year}", yday)
+    os.makedirs(folder, exist_ok=True)
+    nav_path = os.path.join(folder, nav_filename)
+    with open(nav_path, 'wb') as f:
+        f.write(httpx.get(f"{NAV_FILES_URL}/{year}/{yday}/nav/{nav_filename}", timeout=None).raise_for_status().content)
+    extract_path = unzip_gz(nav_path, folder)
+
+    for url, path in ((UPLOAD_NAV_URL, extract_path), (UPLOAD_RINEX_URL, parser.get_rinex_filepath())):
+        with open(path, 'rb') as f:
+            httpx.post(url, files={"rinex": f}, cookies=cookies, timeout=None).raise_for_status()
+
+    systems = dict(parser.get_systems())
+    systems['timestep'] = int(parser.get_timestep())
+    httpx.post(RUN_URL, json=systems, cookies=cookies, timeout=None).raise_for_status()
+
+    os.makedirs(f'{FILE_BASE_PATH}result_csv', exist_ok=True)
+    save_path = os.path.join(f'{FILE_BASE_PATH}result_csv', f'{yday}_{year}.zip')
+    with open(save_path, 'wb') as f:
+        f.write(httpx.get(RESULT_URL, cookies=cookies, timeout=None).raise_for_status().content)
+
+
+async def run_tasks(pipeline: str, parsers: list):
+    from functions import download_sattelite_files
+    from task_store import task_store, TaskStatus
+    from upstream_client import upstream_client
+
+    async def run_task(number: int, parser):
+        task_id = f"bench-{pipeline}-{number}-{uuid.uuid4()}"
+        start = time.perf_counter()
+        if pipeline == 'legacy':
+            # BackgroundTasks запускает синхронные функции в пуле потоков
+            await run_in_threadpool(legacy_pipeline, parser, task_id)
+        else:
+            await task_store.create(task_id)
+            await download_sattelite_files(parser, task_id)
+            task = await task_store.get(task_id)
+            if task.status != TaskStatus.COMPLETED:
+                raise RuntimeError(f"Task {task_id} finished with status {task.status.value}: {task.error}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[run_task(number, parser) for number, parser in enumerate(parsers)])
+    total = time.perf_counter() - start
+    await upstream_client.close()
+    return total, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency of the upstream conversion pipeline")
+    parser.add_argument('--tasks', type=int, default=8, help="concurrent tasks, one day of January each")
+    parser.add_argument('--epochs', type=int, default=20000, help="observation lines in each RINEX file")
+    args = parser.parse_args()
+
+    port = free_port()
+    os.environ.setdefault("RINEX_TO_CSV_URL", f"http://127.0.0.1:{port}/rinex-to-csv")
+    os.environ.setdefault("NAV_FILES_URL", f"http://127.0.0.1:{port}/files2")
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    # config читает адреса из окружения при импорте и создает логгер до смены
+    # рабочей директории, уровень логгера задается после этого
+    from config import RINEX_TO_CSV_URL
+    start_stub(port)
+    quiet_logging()
+    print(f"Conversion service: {RINEX_TO_CSV_URL}")
+
+    print(f"{'pipeline':>10} {'tasks':>6} {'total s':>8} {'mean s':>8} {'max s':>8}")
+    for pipeline in ('legacy', 'pooled'):
+        with tempfile.TemporaryDirectory() as folder:
+            cwd = os.getcwd()
+            os.chdir(folder)
+            try:
+                parsers = [
+                    make_parser(write_rinex(folder, day, args.epochs), day)
+                    for day in range(1, args.tasks + 1)
+                ]
+                total, latencies = asyncio.run(run_tasks(pipeline, parsers))
+            finally:
+                os.chdir(cwd)
+        print(
+            f"{pipeline:>10} {args.tasks:>6} {total:>8.2f} "
+            f"{statistics.mean(latencies):>8.2f} {max(latencies):>8.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
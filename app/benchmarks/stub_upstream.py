@@ -0,0 +1,89 @@
+import asyncio
+import gzip
+import io
+import os
+import random
+import tempfile
+import zipfile
+
+from fastapi import FastAPI, Request, Response, UploadFile
+from fastapi.responses import JSONResponse
+
+from benchmarks.synthetic import write_satellite_day
+
+# Локальная замена simurg.space для проверки конвейера конвертации:
+#   uvicorn benchmarks.stub_upstream:app --port 8001
+#   RINEX_TO_CSV_URL=http://127.0.0.1:8001/rinex-to-csv NAV_FILES_URL=http://127.0.0.1:8001/files2
+# Задержки этапов и доля ответов 503 задаются переменными окружения.
+STUB_UPLOAD_DELAY = float(os.getenv("STUB_UPLOAD_DELAY", 0.2))
+STUB_NAV_DELAY = float(os.getenv("STUB_NAV_DELAY", 0.2))
+STUB_RUN_DELAY = float(os.getenv("STUB_RUN_DELAY", 1.0))
+STUB_RESULT_DELAY = float(os.getenv("STUB_RESULT_DELAY", 0.1))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", 0))
+STUB_SATELLITES = int(os.getenv("STUB_SATELLITES", 40))
+
+app = FastAPI()
+app.state.uploads = {}
+app.state.result = None
+
+
+def build_result_archive(satellites: int = STUB_SATELLITES, site: str = 'test') -> bytes:
+    buffer = io.BytesIO()
+    with tempfile.TemporaryDirectory() as folder:
+        files = write_satellite_day(folder, satellites=satellites, site=site)
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+            for path in files:
+                z.write(path, os.path.basename(path))
+    return buffer.getvalue()
+
+
+async def respond(delay: float):
+    await asyncio.sleep(delay)
+    if random.random() < STUB_FAILURE_RATE:
+        return Response(status_code=503, headers={"Retry-After": "0"})
+    return None
+
+
+def processing_id(request: Request):
+    return request.cookies.get("rinex_to_csv_processing_id", "")
+
+
+@app.get("/files2/{year}/{yday}/nav/{filename}")
+async def nav_file(year: int, yday: str, filename: str):
+    failure = await respond(STUB_NAV_DELAY)
+    if failure:
+        return failure
+    body = gzip.compress(f"stub navigation file {year} {yday}\n".encode() * 1000)
+    return Response(content=body, media_type="application/gzip")
+
+
+@app.post("/rinex-to-csv/upload_rinex")
+@app.post("/rinex-to-csv/upload_nav")
+async def upload(request: Request, rinex: UploadFile):
+    failure = await respond(STUB_UPLOAD_DELAY)
+    if failure:
+        return failure
+    size = len(await rinex.read())
+    app.state.uploads.setdefault(processing_id(request), []).append((request.url.path, size))
+    return JSONResponse({'status': 'ok', 'size': size})
+
+
+@app.post("/rinex-to-csv/run")
+async def run(request: Request):
+    failure = await respond(STUB_RUN_DELAY)
+    if failure:
+        return failure
+    if len(app.state.uploads.get(processing_id(request), [])) < 2:
+        return JSONResponse({'detail': 'files are not uploaded'}, status_code=400)
+    await request.json()
+    return JSONResponse({'status': 'ok'})
+
+
+@app.get("/rinex-to-csv/get_result")
+async def get_result(request: Request):
+    failure = await respond(STUB_RESULT_DELAY)
+    if failure:
+        return failure
+    if app.state.result is None:
+        app.state.result = await asyncio.to_thread(build_result_archive)
+    return Response(content=app.state.result, media_type="application/zip")
@@ -0,0 +1,211 @@
+import gzip
+from pathlib import Path
+
+import numpy as np
+
+SATELLITE_HEADERS = ['tsn', 'hour', 'el', 'az']
+DEFAULT_SIGNALS = ['C1C', 'L1C', 'D1C', 'S1C', 'C2W', 'L2W', 'S2W', 'C5Q', 'L5Q', 'S5Q']
+
+
+def satellite_names(count: int):
+    names = []
+    for system, size in (('G', 32), ('R', 24), ('E', 36), ('C', 46)):
+        names.extend(f"{system}{number:02d}" for number in range(1, size + 1))
+    return names[:count]
+
+
+def get_elevation(seconds: np.ndarray, phase: float, arcs: int = 2, max_elevation: float = 70):
+    # arcs проходов над горизонтом в сутки, часть времени спутник ниже горизонта
+    return max_elevation * np.sin(2 * np.pi * (arcs * seconds / 86400 + phase)) - 5
+
+
+def get_gaps(rng: np.random.Generator, epochs: int, gap_rate: float, gap_length: int = 1):
+    # пропуски сериями по gap_length эпох, в сумме около gap_rate всех эпох
+    starts = rng.random(epochs) < gap_rate / gap_length
+    if gap_length == 1:
+        return starts
+    return np.convolve(starts, np.ones(gap_length, dtype=int))[:epochs] > 0
+
+
+def satellite_rows(
+    rng: np.random.Generator,
+    timestep: float = 30,
+    signals_count: int = len(DEFAULT_SIGNALS),
+    arcs: int = 2,
+    gap_rate: float = 0.002,
+    dropout_rate: float = 0.01,
+    gap_length: int = 1,
+    max_elevation: float = 70,
+):
+    epochs = int(86400 / timestep)
+    tsn = np.arange(epochs, dtype=float)
+    seconds = tsn * timestep
+
+    phase = rng.random()
+    elevation = get_elevation(seconds, phase, arcs, max_elevation)
+    azimuth = (360 * (seconds / 86400 + phase)) % 360
+
+    values = rng.uniform(20, 50, size=(epochs, signals_count))
+    values[elevation <= 0] = 0
+    values[rng.random((epochs, signals_count)) < dropout_rate] = 0
+
+    data = np.column_stack((tsn, seconds / 3600, elevation, azimuth, values))
+    return data[~get_gaps(rng, epochs, gap_rate, gap_length)]
+
+
+def write_satellite_file(path: Path, site: str, satellite: str, data: np.ndarray, signals: list):
+    columns = SATELLITE_HEADERS + list(signals)
+    with open(path, 'w') as f:
+        f.write(f"# Site: {site}\n")
+        f.write(f"# Satellite: {satellite}\n")
+        f.write(f"# Columns: {' '.join(columns)}\n")
+        f.write(' '.join(columns) + '\n')
+        np.savetxt(f, data, fmt='%.6f')
+    return path
+
+
+def write_satellite_day(
+    folder: Path,
+    satellites: int = 100,
+    timestep: float = 30,
+    signals_count: int = len(DEFAULT_SIGNALS),
+    site: str = 'test',
+    seed: int = 0,
+    **rows_options,
+):
+    """Файлы спутников за сутки, rows_options передаются в satellite_rows."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    signals = DEFAULT_SIGNALS[:signals_count]
+
+    files = []
+    for satellite in satellite_names(satellites):
+        data = satellite_rows(rng, timestep=timestep, signals_count=len(signals), **rows_options)
+        path = folder / f"{site}_{satellite}.dat"
+        files.append(str(write_satellite_file(path, site, satellite, data, signals)))
+    return files
+
+
+RINEX_SYSTEMS = {
+    'G': ['C1C', 'L1C', 'D1C', 'S1C', 'C2W', 'L2W', 'D2W', 'S2W', 'C2L', 'L2L', 'D2L', 'S2L', 'C5Q', 'L5Q', 'D5Q', 'S5Q'],
+    'R': ['C1C', 'L1C', 'D1C', 'S1C', 'C2P', 'L2P', 'D2P', 'S2P', 'C2C', 'L2C', 'D2C', 'S2C'],
+    'E': ['C1C', 'L1C', 'D1C', 'S1C', 'C5Q', 'L5Q', 'D5Q', 'S5Q', 'C7Q', 'L7Q', 'D7Q', 'S7Q', 'C8Q', 'L8Q', 'D8Q', 'S8Q'],
+    'C': ['C2I', 'L2I', 'D2I', 'S2I', 'C7I', 'L7I', 'D7I', 'S7I', 'C6I', 'L6I', 'D6I', 'S6I'],
+}
+
+
+def header_record(content: str, label: str):
+    return f"{content:<60}{label:<20}\n"
+
+
+def obs_types_records(system: str, types: list):
+    records = []
+    for start in range(0, len(types), 13):
+        chunk = ''.join(f" {obs_type}" for obs_type in types[start:start + 13])
+        prefix = f"{system}  {len(types):3d}" if start == 0 else " " * 6
+        records.append(header_record(prefix + chunk, "SYS / # / OBS TYPES"))
+    return records
+
+
+def rinex_header(
+    station: str = 'TEST',
+    year: int = 2024,
+    month: int = 1,
+    day: int = 2,
+    interval: float = 30,
+    systems: dict = RINEX_SYSTEMS,
+    comments: int = 10,
+):
+    records = [
+        header_record("     3.04           OBSERVATION DATA    M", "RINEX VERSION / TYPE"),
+        header_record("synthetic           benchmarks          20240102 000000 UTC", "PGM / RUN BY / DATE"),
+    ]
+    records += [header_record(f"synthetic comment line {number}", "COMMENT") for number in range(comments)]
+    records += [
+        header_record(station, "MARKER NAME"),
+        header_record(f"{station} 00001M001", "MARKER NUMBER"),
+        header_record("GEODETIC", "MARKER TYPE"),
+        header_record("observer            agency", "OBSERVER / AGENCY"),
+        header_record("0001                SYNTHETIC RECEIVER  1.0", "REC # / TYPE / VERS"),
+        header_record("0001                SYNTHETIC ANTENNA   NONE", "ANT # / TYPE"),
+        header_record("  2849929.7891  2195892.6103  5249016.0102", "APPROX POSITION XYZ"),
+        header_record("        0.0000        0.0000        0.0000", "ANTENNA: DELTA H/E/N"),
+    ]
+    for system, types in systems.items():
+        records += obs_types_records(system, types)
+    records += [
+        header_record("DBHZ", "SIGNAL STRENGTH UNIT"),
+        header_record(f"{interval:10.3f}", "INTERVAL"),
+        header_record(f"  {year:4d}    {month:2d}    {day:2d}     0     0    0.0000000     GPS", "TIME OF FIRST OBS"),
+        header_record(f"  {year:4d}    {month:2d}    {day:2d}    23    59   30.0000000     GPS", "TIME OF LAST OBS"),
+        header_record(" 18", "LEAP SECONDS"),
+        header_record("", "END OF HEADER"),
+    ]
+    return ''.join(records)
+
+
+def observation_lines(rng: np.random.Generator, types: list, count: int = 1024):
+    # набор строк наблюдений системы: значения случайны, часть пустые, как у реальных приемников
+    values = rng.uniform(1e3, 3e7, size=(count, len(types)))
+    empty = rng.random(values.shape) < 0.1
+    lines = []
+    for row, row_empty in zip(values, empty):
+        fields = (' ' * 16 if skip else f"{value:14.3f} 7" for value, skip in zip(row, row_empty))
+        lines.append(''.join(fields).rstrip() + '\n')
+    return lines
+
+
+def rinex_body(
+    rng: np.random.Generator,
+    satellites: int = 40,
+    interval: float = 30,
+    arcs: int = 2,
+    gap_rate: float = 0.002,
+    gap_length: int = 1,
+    systems: dict = RINEX_SYSTEMS,
+    year: int = 2024,
+    month: int = 1,
+    day: int = 2,
+):
+    """Эпохи наблюдений за сутки блоками строк, в эпоху попадают спутники над горизонтом."""
+    names = satellite_names(satellites)
+    seconds = np.arange(0, 86400, interval, dtype=float)
+    elevation = get_elevation(seconds[None, :], rng.random((len(names), 1)), arcs)
+    visible = elevation > 0
+    present = ~get_gaps(rng, len(seconds), gap_rate, gap_length)
+    lines = {system: observation_lines(rng, types) for system, types in systems.items()}
+    choices = rng.integers(0, 1024, size=visible.shape)
+
+    block = []
+    for epoch in np.flatnonzero(present):
+        second = seconds[epoch]
+        indexes = np.flatnonzero(visible[:, epoch])
+        block.append(
+            f"> {year:4d} {month:02d} {day:02d} {int(second // 3600):02d} {int(second % 3600 // 60):02d}"
+            f"{second % 60:11.7f}  0{len(indexes):3d}\n"
+        )
+        for index in indexes:
+            name = names[index]
+            block.append(name + lines[name[0]][choices[index, epoch]])
+        if len(block) > 100000:
+            yield ''.join(block)
+            block = []
+    yield ''.join(block)
+
+
+def write_rinex_file(
+    path: Path,
+    satellites: int = 40,
+    interval: float = 30,
+    compress: bool = False,
+    seed: int = 0,
+    **body_options,
+):
+    """Файл наблюдений RINEX 3 за сутки, при compress сжатый gzip."""
+    rng = np.random.default_rng(seed)
+    with (gzip.open(path, 'wt', compresslevel=6) if compress else open(path, 'w')) as f:
+        f.write(rinex_header(interval=interval))
+        for block in rinex_body(rng, satellites, interval, **body_options):
+            f.write(block)
+    return path
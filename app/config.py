@@ -1,23 +1,117 @@
+import os
+
 # Constants
 ELEVATION = 10
-FILE_BASE_PATH = f"files"
-UPLOAD_RINEX_URL = 'https://services.simurg.space/rinex-to-csv/upload_rinex'
-UPLOAD_NAV_URL = 'https://services.simurg.space/rinex-to-csv/upload_nav'
-RUN_URL = 'https://services.simurg.space/rinex-to-csv/run'
-RESULT_URL = 'https://services.simurg.space/rinex-to-csv/get_result'
+FILE_BASE_PATH = os.getenv("FILE_BASE_PATH", "files")
+SATELLITE_CACHE_ENABLED = True
+HOLES_CACHE_ENABLED = True
+PARSER_REGISTRY_MAX_SIZE = 128
+PARSER_REGISTRY_TTL = 24 * 60 * 60
+PARSER_REGISTRY_PERSIST = True
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+RINEX_TO_CSV_URL = os.getenv("RINEX_TO_CSV_URL", 'https://services.simurg.space/rinex-to-csv')
+UPLOAD_RINEX_URL = f'{RINEX_TO_CSV_URL}/upload_rinex'
+UPLOAD_NAV_URL = f'{RINEX_TO_CSV_URL}/upload_nav'
+RUN_URL = f'{RINEX_TO_CSV_URL}/run'
+RESULT_URL = f'{RINEX_TO_CSV_URL}/get_result'
+NAV_FILES_URL = os.getenv("NAV_FILES_URL", 'https://simurg.space/files2')
+
+# Таймауты этапов обращения к сервису конвертации, в секундах
+UPSTREAM_TIMEOUTS = {
+    'nav_download': 60,
+    'upload': 300,
+    'run': 900,
+    'result': 300,
+}
+UPSTREAM_CONNECT_TIMEOUT = 10
+UPSTREAM_RETRIES = 3
+UPSTREAM_BACKOFF = 1
+UPSTREAM_MAX_CONNECTIONS = 20
+
+# Кэш навигационных файлов
+NAV_CACHE_MAX_SIZE = 512 * 1024 * 1024
+NAV_CACHE_LOCK_TIMEOUT = 120
+
+# Кэш результатов конвертации: архивы вместе с распакованными папками спутников
+RESULT_CACHE_MAX_SIZE = 5 * 1024 * 1024 * 1024
+# Манифест в папке распакованного результата, его наличие означает завершенную распаковку
+RESULT_MANIFEST_FILENAME = "manifest.json"
+
+# Локальное преобразование наблюдений RINEX в файлы спутников вместо сервиса
+# конвертации, углы считаются по навигационному файлу дня
+LOCAL_CONVERSION = os.getenv("LOCAL_CONVERSION", "0") == "1"
+# Тело файла читается блоками такого размера, память не зависит от длины файла
+LOCAL_CONVERSION_BLOCK_SIZE = 16 * 1024 * 1024
 
 from custom_logger import Logger
 import logging
-import os
+
+# Количество процессов для поиска дыр по спутникам
+HOLES_PROCESS_WORKERS = int(os.getenv("HOLES_PROCESS_WORKERS", os.cpu_count() or 1))
+
+# Ротация лога по размеру и раз в сутки, хранится LOG_BACKUP_COUNT старых файлов
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 30
+# Уровни отдельных модулей, например "functions=INFO,parsers.satellite_parser=WARNING"
+LOG_LEVELS = dict(
+    item.strip().split("=", 1) for item in os.getenv("LOG_LEVELS", "").split(",") if "=" in item
+)
 
 logger = Logger(
     filename= os.path.join('tmp', 'rinex_data_quality_logger.log'),
     console_logging=True,
-    file_logging_level= logging.DEBUG
+    file_logging_level= logging.DEBUG,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    levels=LOG_LEVELS,
 )
 
+# Ответы меньше этого размера не сжимаются
+COMPRESSION_MIN_SIZE = 1024
+
+# Очередь задач конвертации: при JOB_QUEUE_ENABLED API только ставит задачи
+# в очередь, выполняют их отдельные процессы worker.py. По умолчанию выключена:
+# без запущенного воркера задачи из очереди никто не выполнит
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "0") == "1"
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+JOB_VISIBILITY_TIMEOUT = 60
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 10
+JOB_POLL_INTERVAL = 1
+
+# Метрики Prometheus: API отдает их на /metrics, воркер - на этом порту (0 - не отдает).
+# Метрики процессов пула собираются вместе, только если задана общая папка
+# PROMETHEUS_MULTIPROC_DIR (ее читает сам prometheus_client), папка очищается перед запуском
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 0))
+
+# Интервал пустых сообщений в потоке событий задачи, в секундах
+TASK_EVENTS_HEARTBEAT = 15
+# Время хранения состояния задачи в Redis, в секундах
+TASK_TTL = 24 * 60 * 60
+# Сколько запрос ждет завершения задачи, в секундах
+TASK_WAIT_TIMEOUT = 30 * 60
+
+REDIS_HOST = os.getenv("REDIS_HOST", 'redis')
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_MAX_CONNECTIONS = 64
+
 import redis
-try:
-    redis_client = redis.Redis(host='redis', port=6379, db=0)
-except:
-    logger.critical("Redis client is not working")
\ No newline at end of file
+import redis.asyncio
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+
+# Клиенты не подключаются при создании: соединения открываются пулом при первом
+# запросе, а после обрыва переустанавливаются с повтором команды
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+redis_async_client = redis.asyncio.Redis(
+    connection_pool=redis.asyncio.ConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_connect_timeout=5,
+        health_check_interval=30,
+        retry=Retry(ExponentialBackoff(cap=2, base=0.1), 3),
+        retry_on_error=[redis.ConnectionError, redis.TimeoutError],
+    )
+)
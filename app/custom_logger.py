@@ -1,118 +1,189 @@
 import logging
+import logging.handlers
 import sys
-from datetime import datetime
+import atexit
+import fcntl
+import multiprocessing
 import os
-import threading
+import queue
+import time
+
+class RotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Ротация по размеру файла и раз в interval секунд.
+
+    Старые логи переименовываются в <имя>.1 ... <имя>.backup_count, самые
+    старые удаляются, текущий файл не переписывается. Файл пишут несколько
+    процессов (API, воркеры), поэтому ротация идет под блокировкой <имя>.lock,
+    а время изменения этого файла - время последней ротации для всех. Если файл
+    ротировал другой процесс, он открывается заново, как в WatchedFileHandler.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, interval: int):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.interval = interval
+        self.lock_path = f"{filename}.lock"
+        # расписание общее для процессов и уточняется при первой записи
+        self.rollover_at = 0
+        self.file_id = None
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self.file_id = (stat.st_dev, stat.st_ino)
+        return stream
+
+    def emit(self, record: logging.LogRecord):
+        if self.stream is not None:
+            try:
+                stat = os.stat(self.baseFilename)
+                file_id = (stat.st_dev, stat.st_ino)
+            except FileNotFoundError:
+                file_id = None
+            if file_id != self.file_id:
+                self.stream.close()
+                self.stream = None
+        super().emit(record)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.interval and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            rotated_at = os.fstat(lock.fileno()).st_mtime
+            if not self.__is_current():
+                # другой процесс уже ротировал файл
+                if self.stream is not None:
+                    self.stream.close()
+                    self.stream = None
+            elif self.__is_due(rotated_at):
+                super().doRollover()
+                os.utime(self.lock_path)
+                rotated_at = time.time()
+        self.rollover_at = rotated_at + self.interval
+
+    def __is_current(self) -> bool:
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return False
+        return self.stream is None or (stat.st_dev, stat.st_ino) == self.file_id
+
+    def __is_due(self, rotated_at: float) -> bool:
+        if self.interval and time.time() >= rotated_at + self.interval:
+            return True
+        return self.maxBytes > 0 and os.path.getsize(self.baseFilename) >= self.maxBytes
+
 
 class Logger:
+    """Логгер приложения с записью в отдельном потоке.
+
+    Вызовы логирования только кладут запись в очередь, файл и консоль пишет
+    QueueListener в фоновом потоке. Процессы пула, созданные через fork, не
+    пишут файл сами, а передают записи в процесс, создавший логгер, через
+    очередь multiprocessing. Сообщения принимают аргументы в стиле %,
+    которые подставляются только если уровень включен. Уровни отдельных
+    модулей задаются через levels и get_child.
+    """
     __default_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     __root_logger = logging.getLogger("rinex_data_quality_logger")
-    __last_cleanup = None
-    
+
     def __init__(
             self,
             filename: str,
             file_logging_level=logging.INFO,
             console_logging: bool = False,
             console_logging_level=logging.DEBUG,
-            cleanup_interval: int = 86400,  # Интервал проверки логов в секундах (24 часа = 86400 секунд)
+            max_bytes: int = 50 * 1024 * 1024,
+            backup_count: int = 30,
+            rotation_interval: int = 86400,  # Ротация раз в сутки даже без превышения размера
+            levels: dict = None,  # Уровни модулей: {'functions': 'INFO', ...}
         ):
         self.filename = filename
-        self.cleanup_interval = cleanup_interval
-        self.__last_cleanup = datetime.now()
-        
-        self.__start_cleanup_thread()
-        
-        self.__root_logger.setLevel(min(file_logging_level, console_logging_level))
+        self.file_logging_level = file_logging_level
+        self.console_logging = console_logging
+        self.console_logging_level = console_logging_level
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotation_interval = rotation_interval
+        self.listener = None
+        self.children_listener = None
+        # записи процессов пула, их читает поток этого процесса
+        self.__children_records = multiprocessing.Queue()
 
-        file_handler = logging.FileHandler(self.filename)
-        file_handler.setLevel(file_logging_level)
-        file_formatter = logging.Formatter(self.__default_format)
-        file_handler.setFormatter(file_formatter)
-
-        self.__root_logger.addHandler(file_handler)
-
-        if console_logging:
+        self.__root_logger.setLevel(min(file_logging_level, console_logging_level))
+        for name, level in (levels or {}).items():
+            self.get_child(name).setLevel(level)
+
+        self.__start_listener()
+        # процессы пула наследуют очередь без потока, который ее читает
+        os.register_at_fork(after_in_child=self.__forward_to_parent)
+        atexit.register(self.stop)
+
+    def __start_listener(self):
+        formatter = logging.Formatter(self.__default_format)
+        file_handler = RotatingFileHandler(self.filename, self.max_bytes, self.backup_count, self.rotation_interval)
+        file_handler.setLevel(self.file_logging_level)
+        file_handler.setFormatter(formatter)
+        handlers = [file_handler]
+
+        if self.console_logging:
             console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setLevel(console_logging_level)
-            console_formatter = logging.Formatter(self.__default_format)
-            console_handler.setFormatter(console_formatter)
-            self.__root_logger.addHandler(console_handler)
-
-    def _file_handler_exists(self, filename: str) -> bool:
-        """Проверка, существует ли уже файловый обработчик."""
-        for handler in self.__root_logger.handlers:
-            if isinstance(handler, logging.FileHandler) and handler.baseFilename == filename:
-                return True
-        return False
-    
-    def __start_cleanup_thread(self):
-        """Запуск фонового потока для периодической проверки и очистки логов."""
-        def cleanup_logs_periodically():
-            while True:
-                current_time = datetime.now()
-                # Проверяем, прошло ли больше cleanup_interval времени с последней очистки
-                if (current_time - self.__last_cleanup).total_seconds() >= self.cleanup_interval:
-                    self.__remove_old_logs_from_file()
-                    self.__last_cleanup = current_time
-                # Ждем час перед следующей проверкой
-                threading.Event().wait(3600)
-
-        # Запускаем поток очистки
-        cleanup_thread = threading.Thread(target=cleanup_logs_periodically, daemon=True)
-        cleanup_thread.start()
-
-            
-    def __remove_old_logs_from_file(self, days_threshold: int = 30) -> None:
-        """Удаление строк логов старше определенного количества дней.
-        Создание копии файла и замена оригинального на копию
-        """
-        if not os.path.exists(self.filename):
-            return
-
-        temp_filename = self.filename + ".tmp"
-        current_time = datetime.now()
-
-        with open(self.filename, "r") as log_file, open(temp_filename, "w") as temp_file:
-            log_is_old = True
-
-            for line in log_file:
-                log_date = self.__extract_log_date(line)
-
-                if log_date:
-                    if (current_time - log_date).days <= days_threshold:
-                        log_is_old = False
-
-                if not log_is_old:
-                    temp_file.write(line)
-
-        os.replace(temp_filename, self.filename)
-                
-    def __extract_log_date(self, line: str) -> datetime:
-        """Извлекает дату лога из строки"""
-        try:
-            date_str = line.split(" - ")[0]
-            return datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S,%f")
-        except (IndexError, ValueError):
-            return None
+            console_handler.setLevel(self.console_logging_level)
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        records = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self.children_listener = logging.handlers.QueueListener(
+            self.__children_records, *handlers, respect_handler_level=True
+        )
+        self.children_listener.start()
+        self.__set_queue(records)
+
+    def __forward_to_parent(self):
+        # потоки записи остались в родителе, их обработчики здесь не используются
+        self.listener = None
+        self.children_listener = None
+        self.__set_queue(self.__children_records)
+
+    def __set_queue(self, records):
+        for handler in list(self.__root_logger.handlers):
+            self.__root_logger.removeHandler(handler)
+        self.__root_logger.addHandler(logging.handlers.QueueHandler(records))
+
+    def stop(self):
+        """Дописывает записи из очередей и останавливает потоки записи."""
+        for listener in (self.listener, self.children_listener):
+            if listener is not None:
+                listener.stop()
+        self.listener = None
+        self.children_listener = None
+
+    def get_child(self, name: str) -> logging.Logger:
+        """Логгер модуля, уровень которого можно задать отдельно."""
+        return self.__root_logger.getChild(name)
 
     # Методы для логгирования на разных уровнях
-    def debug(self, message: str) -> None:
+    def debug(self, message: str, *args, **kwargs) -> None:
         """Логгирование на уровне DEBUG"""
-        self.__root_logger.debug(message)
+        self.__root_logger.debug(message, *args, stacklevel=2, **kwargs)
 
-    def info(self, message: str) -> None:
+    def info(self, message: str, *args, **kwargs) -> None:
         """Логгирование на уровне INFO"""
-        self.__root_logger.info(message)
+        self.__root_logger.info(message, *args, stacklevel=2, **kwargs)
 
-    def warning(self, message: str) -> None:
+    def warning(self, message: str, *args, **kwargs) -> None:
         """Логгирование на уровне WARNING"""
-        self.__root_logger.warning(message)
+        self.__root_logger.warning(message, *args, stacklevel=2, **kwargs)
 
-    def error(self, message: str) -> None:
+    def error(self, message: str, *args, **kwargs) -> None:
         """Логгирование на уровне ERROR"""
-        self.__root_logger.error(message)
+        self.__root_logger.error(message, *args, stacklevel=2, **kwargs)
 
-    def critical(self, message: str) -> None:
+    def critical(self, message: str, *args, **kwargs) -> None:
         """Логгирование на уровне CRITICAL"""
-        self.__root_logger.critical(message)
+        self.__root_logger.critical(message, *args, stacklevel=2, **kwargs)
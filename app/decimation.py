@@ -0,0 +1,63 @@
+import numpy as np
+from typing import Optional
+
+# Первые колонки матрицы спутника: tsn, время в секундах, el, az, дальше сигналы
+POSITION_COLUMNS = 4
+
+
+def select_time_range(data: np.ndarray, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+    """Строки со временем от начала суток в секундах в интервале [start, end]."""
+    seconds = data[:, 1]
+    mask = np.ones(len(data), dtype=bool)
+    if start is not None:
+        mask &= seconds >= start
+    if end is not None:
+        mask &= seconds <= end
+    return data[mask]
+
+
+def decimate(data: np.ndarray, max_points: int) -> np.ndarray:
+    """Прореживание min/max по корзинам для всех сигналов сразу.
+
+    Строки делятся на корзины равного размера, каждая корзина заменяется
+    двумя строками. Колонки tsn, время, el, az берутся из первой и последней
+    строки корзины, у каждого сигнала - минимум и максимум корзины в том
+    порядке, в котором они встретились. Нули всегда являются минимумом,
+    поэтому разрывы сигнала остаются видны на графике.
+    """
+    rows_count = len(data)
+    if rows_count <= max_points:
+        return data
+
+    buckets_count = max(max_points // 2, 1)
+    bucket_size = -(-rows_count // buckets_count)
+    buckets_count = -(-rows_count // bucket_size)
+
+    # последняя корзина дополняется NaN до полного размера
+    padded = np.full((buckets_count * bucket_size, data.shape[1]), np.nan)
+    padded[:rows_count] = data
+    buckets = padded.reshape(buckets_count, bucket_size, data.shape[1])
+
+    last_rows = np.minimum(np.arange(1, buckets_count + 1) * bucket_size, rows_count) - 1
+    first = data[np.arange(buckets_count) * bucket_size]
+    last = data[last_rows]
+
+    result = np.empty((buckets_count, 2, data.shape[1]))
+    result[:, 0, :POSITION_COLUMNS] = first[:, :POSITION_COLUMNS]
+    result[:, 1, :POSITION_COLUMNS] = last[:, :POSITION_COLUMNS]
+
+    signals = buckets[:, :, POSITION_COLUMNS:]
+    if signals.shape[2]:
+        min_positions = np.nanargmin(signals, axis=1)
+        max_positions = np.nanargmax(signals, axis=1)
+        minimums = np.take_along_axis(signals, min_positions[:, None, :], axis=1)[:, 0, :]
+        maximums = np.take_along_axis(signals, max_positions[:, None, :], axis=1)[:, 0, :]
+        min_first = min_positions <= max_positions
+        result[:, 0, POSITION_COLUMNS:] = np.where(min_first, minimums, maximums)
+        result[:, 1, POSITION_COLUMNS:] = np.where(min_first, maximums, minimums)
+    result = result.reshape(-1, data.shape[1])
+
+    # корзина из одной строки дала бы две одинаковые точки
+    if last_rows[-1] == (buckets_count - 1) * bucket_size:
+        result = result[:-1]
+    return result
@@ -1,226 +1,214 @@
 from parsers.satellite_parser import SatelliteParser
 from parsers.rinex_parser import RinexParser
+from holes import aggregate_holes
+from holes_cache import holes_cache
+from decimation import decimate, select_time_range
+from upstream_client import upstream_client
+from nav_cache import nav_cache
+from result_cache import result_cache
+from geometry import BroadcastGeometry
+from local_conversion import LocalConverter
+from task_store import task_store, TaskStatus
+from metrics import TASKS_IN_FLIGHT, count_bytes, count_cache, timed
 
 from config import *
 
 import zipfile
 from pathlib import Path
+from typing import Callable
 import numpy as np
 
-import requests
+import asyncio
+import fnmatch
+import glob
 import os
 import shutil
+import tempfile
+import time
 import gzip
 import json
+import logging
+
+# уровень модуля задается через LOG_LEVELS
+logger = logger.get_child(__name__)
 
             
-def upload_nav_file(year: int, yday: str, nav_filename: str, cookies: dict):
-    logger.info(f"Uploading navigation file. Params: doy = {yday}, year={year}, filename={nav_filename}")
-    
-    href = f"https://simurg.space/files2/{year}/{yday}/nav/{nav_filename}"
-    download_folder = os.path.join(FILE_BASE_PATH, 'downloaded_files', f"{year}", yday)
-    os.makedirs(download_folder, exist_ok=True)
-    save_path = os.path.join(download_folder, nav_filename)
-    
-    logger.debug(f"Downloading nav file from {href} to {save_path}")
-    download_nav_file(href, save_path)
-    
-    logger.debug(f"Unzipping file: {save_path}")
-    extract_path = unzip_gz(save_path, download_folder)
-    
-    logger.info(f"Sending file to server. Path: {extract_path}")
-    send_file(
-        path=extract_path,
-        cookies=cookies,
-        url=UPLOAD_NAV_URL
-    )
-    return extract_path
-    
+async def upload_nav_file(year: int, yday: str, cookies: dict, task_id: str = None):
+    logger.info(f"Uploading navigation file. Params: doy = {yday}, year={year}")
+    nav_path = await nav_cache.get(year, yday)
+    if task_id is not None:
+        await task_store.update(task_id, TaskStatus.PROCESSING, stage='upload')
     
-def download_nav_file(url, save_path):
-    logger.info(f"Downloading navigation file from {url}")
-    response = requests.get(url, stream=True)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        logger.info("Navigation file downloaded successfully")
-        return save_path
-    else:
-        logger.error(f"Failed to download navigation file. Status code: {response.status_code}")
-        response.raise_for_status()
+    # в кэше файл хранится сжатым, на сервис отправляется распакованная копия
+    with tempfile.TemporaryDirectory() as extract_folder:
+        logger.debug(f"Unzipping file: {nav_path}")
+        extract_path = await asyncio.to_thread(unzip_gz, nav_path, extract_folder)
+        
+        logger.info(f"Sending file to server. Path: {extract_path}")
+        await upstream_client.upload(UPLOAD_NAV_URL, extract_path, stage='upload', cookies=cookies)
+    return nav_path
+
+
+async def upload_rinex_file(parser: RinexParser, cookies: dict):
+    rinex_path = await asyncio.to_thread(parser.get_rinex_filepath)
+    logger.info(f"Sending file to server. Path: {rinex_path}")
+    await upstream_client.upload(UPLOAD_RINEX_URL, rinex_path, stage='upload', cookies=cookies)
+    return rinex_path
         
 
-def find_holes(file: SatelliteParser, data_period: int, timestep: int):
+@timed('find_holes')
+def find_holes(file: SatelliteParser, data_period: int, timestep: int) -> tuple[dict, bool]:
+    """Дыры по периодам и признак того, что вклады строк взяты из кэша."""
     data = file.get_data()
-    logging_id = f'{file.get_filename()}'
+    logging_id = file.get_filename()
     headers = file.get_headers()
-    logger.debug(f"Retrieved data and headers. Headers: {headers} in {logging_id}")
+    logger.debug("Retrieved data and headers. Headers: %s in %s", headers, logging_id)
 
     period_records = int((data_period * 60) / timestep)
     records_count = int(24*(60/data_period))
-    logger.debug(f"Calculated period_records: {period_records}, records_count: {records_count} in {logging_id}")
+    logger.debug("Calculated period_records: %s, records_count: %s in %s", period_records, records_count, logging_id)
 
-
-    holes = {
-        "actual": {},
-        "potencial": {}
-    }
-    
     signals = headers[4:]
-    logger.debug(f"Identified signals: {signals} in {logging_id}")
+    logger.debug("Identified signals: %s in %s", signals, logging_id)
     
     if data is None:
-        logger.warning(f"No data available in {logging_id}, initializing holes with -1")
-        holes = holes["actual"]
+        logger.warning("No data available in %s, initializing holes with -1", logging_id)
+        holes = {}
         for signal in signals:
             holes[signal] = np.full(records_count, -1)
-        return holes
+        return holes, False
     
-    for signal in signals:
-        holes["actual"][signal] = np.array([-1]) 
-        holes["potencial"][signal] = np.array([0]) 
+    holes = {signal: np.array([-1]) for signal in signals}
     
     unworking_signals_count = 0 
     if len(signals) != len(data[1][4:]):
         unworking_signals_count = len(signals) - len(data[1][4:])
         signals = signals[:-unworking_signals_count]
-        logger.warning(f"Adjusted signals due to unworking signals. New signals: {signals} in {logging_id}")
-
-    
-    records = 0
-    was_data=False
-    is_send_period_started = False
-    prev_tsn = 0
-    period_start_tsn = 0
-
-    def check_for_hole():
-        nonlocal datas, holes, records, curr_tsn, prev_tsn, is_send_period_started, was_data, period_start_tsn
-        
-        if np.all(datas == 0) and not is_send_period_started:
-            if prev_tsn + 1 < curr_tsn:
-                records += int(curr_tsn) - int(prev_tsn)-1
-            prev_tsn = curr_tsn
-            return
-
-        if np.any(datas > 0) and not is_send_period_started:
-            logger.debug(f"Sending period is started. Period without data: start_tsn = {period_start_tsn}, end_tsn = {curr_tsn-1} in {logging_id}")
-            period_start_tsn = curr_tsn
-            is_send_period_started = True
-            if prev_tsn + 1 < curr_tsn:
-                records += int(curr_tsn) - int(prev_tsn)-1
-            prev_tsn = curr_tsn
-            for signal in signals:
-                holes["actual"][signal][-1] += 1 
-                           
-        if np.any(datas>0) and not was_data:
-            was_data = True
-
-        if np.any(datas > 0) and prev_tsn + 1 < curr_tsn:
-            logger.debug(f"Data gap found between {period_start_tsn} and {curr_tsn-1} TSNs in {logging_id}")
-            period_start_tsn = curr_tsn
-            for signal in signals:
-                holes["actual"][signal] += holes["potencial"][signal]
-                holes['actual'][signal][-1] += int(curr_tsn) - int(prev_tsn)
-                
-            records += int(curr_tsn) - int(prev_tsn)
-            prev_tsn = curr_tsn
-            return
-
-        if np.any(datas > 0) and np.any(datas == 0):
-            for value, signal in zip(datas, signals):
-                if value == 0:
-                    holes['actual'][signal][-1] += 1
-            
-                holes["actual"][signal] = holes["actual"][signal] + holes["potencial"][signal]
-                holes["potencial"][signal] = np.zeros_like(holes["potencial"][signal])
-            
-            prev_tsn = curr_tsn
-            return
-
-        if np.all(datas == 0) and elev > ELEVATION:
-            for signal in signals:
-                holes['potencial'][signal][-1]+=1
-            prev_tsn = curr_tsn
-            return
-        
-        if np.all(datas > 0):
-            for signal in signals:
-                if np.all(holes["potencial"][signal] == 0):
-                    continue
-                holes['actual'][signal]+=holes["potencial"][signal]
-                holes["potencial"][signal] = np.zeros_like(holes["potencial"][signal])
-            prev_tsn = curr_tsn
-            return
-
-        if np.all(datas == 0) and elev < ELEVATION:
-            logger.debug(f"Data missing and elevation is low. Sending period end. Period with data: start_tsn = {period_start_tsn}, period_end = {curr_tsn-1} in {logging_id}")
-            period_start_tsn = curr_tsn
-            for signal in signals:
-                if not was_data:
-                    holes['actual'][signal][-1]=-1
-                
-                holes["potencial"][signal] = np.zeros_like(holes["potencial"][signal])
-            
-            is_send_period_started = False
-            prev_tsn = curr_tsn
-            return
-
-        prev_tsn = curr_tsn
-
-    for row in data:
-        curr_tsn = row[0]
-        elev = row[2]
-        datas = row[4:]
-        
-        records += 1
-        check_for_hole()
-        if records > period_records:
-            end_number = 0 if is_send_period_started else -1
-            
-            for _ in range(records//period_records):
-                for signal in signals:
-                    holes["actual"][signal] = np.append(holes["actual"][signal], end_number)
-                    holes["potencial"][signal] = np.append(holes["potencial"][signal], 0)
-            was_data=False
-            records = records%period_records
-    
-    if is_send_period_started:
-        logger.debug(f"Last period was with data. start_tsn = {period_start_tsn}, end_tsn = {curr_tsn} in {logging_id}")
-    else:
-        logger.debug(f"Last period was without data. start_tsn = {period_start_tsn}, end_tsn = {curr_tsn} in {logging_id}")
+        logger.warning("Adjusted signals due to unworking signals. New signals: %s in %s", signals, logging_id)
 
-    
-                    
-    for signal in signals:        
-        holes["actual"][signal] += holes["potencial"][signal]           
-                
-    holes = holes["actual"]
+    events, cached = holes_cache.get_events(file)
+    holes.update(aggregate_holes(events, signals, period_records))
     
     for signal in holes:
         missing_entries = records_count - len(holes[signal])
         if missing_entries > 0:
-            logger.debug(f"Adding missing entries for signal: {signal}, count: {missing_entries} in {logging_id}")
-            for _ in range(missing_entries):
-                holes[signal] = np.append(holes[signal], -1)
+            logger.debug("Adding missing entries for signal: %s, count: %s in %s", signal, missing_entries, logging_id)
+            holes[signal] = np.concatenate((holes[signal], np.full(missing_entries, -1)))
     
     if unworking_signals_count > 0:
-        logger.debug(f"Handling unworking signals, count: {unworking_signals_count} in {logging_id}")
+        logger.debug("Handling unworking signals, count: %s in %s", unworking_signals_count, logging_id)
         signals = headers[-unworking_signals_count:]
         for signal in signals:
             holes[signal] = np.full(records_count, -1)
     
     
-    hole_count = 0
-    for signal in signals:
-        if np.any(holes[signal] > 0):
-            positive_holes = holes[signal][holes[signal] > 0]
-            hole_count += np.sum(positive_holes)
+    # подсчет нужен только для сообщения, при выключенном INFO он пропускается
+    if logger.isEnabledFor(logging.INFO):
+        hole_count = 0
+        for signal in signals:
+            if np.any(holes[signal] > 0):
+                positive_holes = holes[signal][holes[signal] > 0]
+                hole_count += np.sum(positive_holes)
+        
+        logger.info("find_holes function completed successfully. Number of holes found: %s in %s", hole_count, logging_id)
+    return holes, cached
+ 
+ 
+def find_satellite_holes(file: Path, data_period: int, timestep: int):
+    satellite = SatelliteParser.load(file)
+    holes, cached = find_holes(satellite, data_period, timestep)
     
-    logger.info(f"find_holes function completed successfully. Number of holes found: {hole_count} in {logging_id}")
-    return holes
+    transformed_data = []
+    for key, value in holes.items():
+        signal_holes_dict = {"x": key, "y": value}
+        transformed_data.append(signal_holes_dict)
+    
+    data = {}
+    data['id'] = satellite.get_satellite()
+    data['data'] = transformed_data
+    return data, cached
+ 
+ 
+def find_satellite_holes_line(file: Path, data_period: int, timestep: int, index: int) -> tuple[bytes, bool]:
+    """Дыры спутника строкой NDJSON, сериализация выполняется в процессе пула."""
+    data, cached = find_satellite_holes(file, data_period, timestep)
+    data['index'] = index
+    return json.dumps(convert_numpy_to_list(data), separators=(",", ":")).encode() + b"\n", cached
  
  
+@timed('load_series')
+def load_satellite_series(
+    filepath: Path,
+    timestep: float,
+    max_points: int = None,
+    time_start: float = None,
+    time_end: float = None,
+):
+    satellite = SatelliteParser.load(filepath)
+    data = satellite.get_data()
+    if data is None:
+        logger.debug(f"Sattelite file is empty: {filepath}")
+        return None
+    
+    if time_start is not None or time_end is not None:
+        data = select_time_range(data, time_start, time_end)
+    if max_points is not None:
+        rows_count = len(data)
+        data = decimate(data, max_points)
+        logger.debug(f"Satellite file {filepath} decimated from {rows_count} to {len(data)} rows")
+    
+    return {
+        'tsn': data[:, 0],
+        'seconds': data[:, 1],
+        'elevation': data[:, 2],
+        'signals': satellite.get_signals(),
+        'data': data[:, 4:].T,
+        'timestep': timestep
+    }
+
+
+def get_result_key(parser: RinexParser) -> str:
+    systems = dict(parser.get_systems())
+    systems['timestep'] = int(parser.get_timestep())
+    return result_cache.get_key(parser, systems)
+
+
+def get_satellite_folder(parser: RinexParser) -> str:
+    """Папка с файлами спутников, распакованными из результата конвертации задачи."""
+    date = parser.get_date()
+    year = date.year
+    yday = str(date.timetuple().tm_yday).zfill(3)
+    return os.path.join(FILE_BASE_PATH, "satellite", f"{year}", yday, get_result_key(parser))
+
+
+def get_satellite_filepath(parser: RinexParser, satellite: str):
+    date = parser.get_date()
+    year = date.year
+    yday = str(date.timetuple().tm_yday).zfill(3)
+    
+    radar = parser.get_radar_name().lower()
+    filename = f'{radar}_{satellite}_{yday}_{year%100}.dat'
+    return os.path.join(get_satellite_folder(parser), filename)
+
+
+def find_satellite_filepaths(parser: RinexParser, patterns: list) -> dict:
+    """Файлы спутников задачи по списку имен или шаблонов вида G*, в порядке запроса."""
+    available = {
+        os.path.basename(filepath).split('_')[-3]: filepath
+        for filepath in sorted(glob.glob(get_satellite_filepath(parser, '*')))
+    }
+    
+    filepaths = {}
+    for pattern in patterns:
+        if not any(char in pattern for char in '*?['):
+            # явно запрошенный спутник попадает в ответ, даже если файла нет
+            filepaths.setdefault(pattern, available.get(pattern, get_satellite_filepath(parser, pattern)))
+            continue
+        for satellite in fnmatch.filter(available, pattern):
+            filepaths.setdefault(satellite, available[satellite])
+    return filepaths
+
+
 def convert_numpy_to_list(d):
     if isinstance(d, dict):
         return {k: convert_numpy_to_list(v) for k, v in d.items()}
@@ -232,6 +220,7 @@ def convert_numpy_to_list(d):
         return d
 
         
+@timed('unzip_gz')
 def unzip_gz(file_path, extract_to_folder):
     logger.info(f"Unzipping gz archive: {file_path}")
     with gzip.open(file_path, 'rb') as f_in:
@@ -241,6 +230,7 @@ def unzip_gz(file_path, extract_to_folder):
     logger.info(f"Gz archive unzipped to {extract_path}")
     return extract_path
 
+@timed('unzip_zip')
 def unzip_zip(
     file_path: Path,
     extract_to_folder: Path
@@ -256,22 +246,68 @@ def unzip_zip(
         else:
             for name in file_names:
                 files.append(z.extract(name, extract_to_folder))
+            count_bytes('unzip_zip', sum(info.file_size for info in z.infolist()))
                 
     logger.info(f"Zip archive unzipped to {files}")
     return files
 
 
-def send_file(path, cookies, url):
-    logger.info(f"Sending file {path} to {url}")
-    with open(path, "rb") as f:
-        files = {"rinex": f}
-        response = requests.post(url, files=files, cookies=cookies)
-        if response.status_code == 200:
-            logger.info(f"File sent successfully to {url}")
-        else:
-            logger.error(f"Failed to send file. Status code: {response.status_code}")
-            response.raise_for_status()
+@timed('extract')
+def extract_result(file_path: Path, extract_to_folder: Path) -> list:
+    """Распаковывает архив результата один раз и возвращает пути файлов."""
+    return publish_result(extract_to_folder, lambda folder: unzip_zip(file_path, folder), file_path)
+
+
+def publish_result(folder: Path, produce: Callable[[str], list], source: Path) -> list:
+    """Создает папку результата один раз и возвращает пути файлов.
+
+    produce пишет файлы во временную папку рядом с целевой, туда же пишется
+    манифест, затем папка атомарно переименовывается. Повторные вызовы читают
+    манифест и не трогают файлы, которые в это время могут читать другие запросы.
+    """
+    files = read_manifest(folder)
+    if files is not None:
+        logger.info(f"Result files already exist in {folder}")
+        return files
     
+    parent = os.path.dirname(folder)
+    os.makedirs(parent, exist_ok=True)
+    tmp_folder = tempfile.mkdtemp(dir=parent, prefix=".extract-")
+    try:
+        names = [os.path.relpath(file, tmp_folder) for file in produce(tmp_folder)]
+        manifest = {
+            'source': os.path.basename(source),
+            'files': names,
+            'created_at': time.time(),
+        }
+        with open(os.path.join(tmp_folder, RESULT_MANIFEST_FILENAME), 'w') as f:
+            json.dump(manifest, f)
+        os.rename(tmp_folder, folder)
+    except OSError as e:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        # папку уже переименовал параллельный запрос с тем же результатом
+        files = read_manifest(folder)
+        if files is None:
+            raise
+        logger.debug(f"Result files were created concurrently in {folder}: {e}")
+        return files
+    except BaseException:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        raise
+    
+    logger.info(f"Result files created in {folder} from {source}, files: {len(names)}")
+    return [os.path.join(folder, name) for name in names]
+
+
+def read_manifest(folder: Path):
+    try:
+        with open(os.path.join(folder, RESULT_MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return [os.path.join(folder, name) for name in manifest['files']]
+
+
 def get_graph_data(signals: dict, task_id: str):
     logger.info(f"Preparing graph data from signals for task: {task_id}")
     
@@ -290,66 +326,112 @@ def get_graph_data(signals: dict, task_id: str):
     logger.debug(f"Graph data successfully prepared for task: {task_id}")
     return graph_data
 
-def download_sattelite_files(parser: RinexParser, task_id: str):
+async def download_sattelite_files(parser: RinexParser, task_id: str):
     try:
-        logger.info(f"Downloading satellite files for task {task_id}")
-        
-        date = parser.get_date()
-        year = date.year
-        yday = str(date.timetuple().tm_yday).zfill(3)
-        
-        save_path = os.path.join(f'{FILE_BASE_PATH}result_csv', f'{yday}_{year}.zip')
+        with TASKS_IN_FLIGHT.track_inprogress():
+            await process_task(parser, task_id)
+    except Exception as e:
+        logger.error(f"Error during file download process: {e}")
+        await task_store.update(task_id, TaskStatus.FAILED, error=str(e))
 
-        if os.path.exists(save_path):
-            logger.info(f"Task {task_id} already completed. File exists at {save_path}")
-            redis_client.set(task_id, json.dumps({'status': 'completed', 'result': save_path}))
+
+@timed('task')
+async def process_task(parser: RinexParser, task_id: str):
+    logger.info(f"Downloading satellite files for task {task_id}")
+    
+    date = parser.get_date()
+    year = date.year
+    yday = str(date.timetuple().tm_yday).zfill(3)
+    
+    systems = dict(parser.get_systems())
+    timestep = parser.get_timestep()
+    systems['timestep'] = int(timestep)
+    
+    cache_key = await asyncio.to_thread(result_cache.get_key, parser, systems)
+    extract_to_folder = os.path.join(FILE_BASE_PATH, "satellite", f"{year}", yday, cache_key)
+    files = await asyncio.to_thread(read_manifest, extract_to_folder)
+    count_cache('extracted', files is not None)
+    if files is not None:
+        # результат уже распакован, архив не нужен
+        logger.info(f"Task {task_id} already completed. Files exist at {extract_to_folder}")
+        await asyncio.to_thread(result_cache.touch, extract_to_folder)
+        await task_store.update(task_id, TaskStatus.COMPLETED, result=result_cache.get_path(cache_key), files=files)
+        return
+    
+    if LOCAL_CONVERSION:
+        if parser.get_radar_coords() is not None:
+            files = await convert_rinex_file_locally(parser, task_id, extract_to_folder)
+            await asyncio.to_thread(result_cache.evict, cache_key)
+            await task_store.update(task_id, TaskStatus.COMPLETED, result=extract_to_folder, files=files)
             return
-        
-        redis_client.set(task_id, json.dumps({'status': 'processing'}))
+        logger.warning(f"No APPROX POSITION XYZ in {parser.get_filename()}, falling back to remote conversion")
+    
+    save_path = await asyncio.to_thread(result_cache.get, cache_key)
+    if save_path is not None:
+        logger.info(f"Task {task_id} already completed. File exists at {save_path}")
+    else:
+        save_path = await convert_rinex_file(parser, task_id, cache_key, systems)
+    
+    await task_store.update(task_id, TaskStatus.PROCESSING, stage='extracting')
+    files = await asyncio.to_thread(extract_result, save_path, extract_to_folder=extract_to_folder)
+    # объем кэша считается вместе с распакованной папкой
+    await asyncio.to_thread(result_cache.evict, cache_key)
+    
+    await task_store.update(task_id, TaskStatus.COMPLETED, result=save_path, files=files)
+
+
+async def convert_rinex_file_locally(parser: RinexParser, task_id: str, folder: str) -> list:
+    date = parser.get_date()
+    year = date.year
+    yday = str(date.timetuple().tm_yday).zfill(3)
+    
+    await task_store.update(task_id, TaskStatus.PROCESSING, stage='nav_download')
+    nav_path = await nav_cache.get(year, yday)
+    
+    await task_store.update(task_id, TaskStatus.PROCESSING, stage='converting')
+    return await asyncio.to_thread(run_local_conversion, parser, nav_path, folder)
+
+
+@timed('local_conversion')
+def run_local_conversion(parser: RinexParser, nav_path: str, folder: str) -> list:
+    """Файлы спутников без сервиса конвертации, публикуются так же, как распакованный архив."""
+    geometry = BroadcastGeometry(nav_path, parser.get_radar_coords(), parser.get_date())
+    converter = LocalConverter(parser, geometry)
+    return publish_result(folder, converter.convert, parser.get_rinex_filepath())
+
 
-        nav_filename = f'BRDC00IGS_R_{year}{yday}0000_01D_MN.rnx.gz'
-        rinex_to_csv_processing_id = f"{parser.get_filename()}-_-{nav_filename}"
-        cookies = {"rinex_to_csv_processing_id": rinex_to_csv_processing_id}
+async def convert_rinex_file(parser: RinexParser, task_id: str, cache_key: str, systems: dict):
+    date = parser.get_date()
+    year = date.year
+    yday = str(date.timetuple().tm_yday).zfill(3)
+    
+    await task_store.update(task_id, TaskStatus.PROCESSING, stage='nav_download')
+    nav_filename = nav_cache.get_nav_filename(year, yday)
+    rinex_to_csv_processing_id = f"{parser.get_filename()}-_-{nav_filename}"
+    cookies = {"rinex_to_csv_processing_id": rinex_to_csv_processing_id}
 
-        logger.debug("Uploading navigation file")
+    logger.debug("Uploading navigation and RINEX files")
+    await asyncio.gather(
         upload_nav_file(
             year=year,
             yday=yday,
-            nav_filename=nav_filename,
-            cookies=cookies
-        )
-        
-        logger.debug("Uploading RINEX file")
-        rinex_path = parser.get_filepath()
-        send_file(
-            path=rinex_path,
             cookies=cookies,
-            url=UPLOAD_RINEX_URL
-        )
-
-        systems = parser.get_systems()
-        timestep = parser.get_timestep()
-        systems['timestep'] = int(timestep)      
-
-        
-        logger.debug("Posting signals data")
-        response = requests.post(RUN_URL, json=systems, cookies=cookies)
-        
-        
-        logger.debug("Retrieving result from server")
-        response = requests.get(RESULT_URL, cookies=cookies)
-        os.makedirs(f'{FILE_BASE_PATH}result_csv', exist_ok=True)
-        
-        if response.status_code == 200:
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            logger.info("Result file downloaded successfully")
-        else:
-            logger.error(f"Failed to retrieve result. Status code: {response.status_code}")
-            response.raise_for_status()
+            task_id=task_id
+        ),
+        upload_rinex_file(parser, cookies)
+    )
 
-        redis_client.set(task_id, json.dumps({'status': 'completed', 'result': save_path}))
-    except Exception as e:
-        logger.error(f"Error during file download process: {e}")
-        redis_client.set(task_id, json.dumps({'status': 'failed', 'error': str(e)}))
\ No newline at end of file
+    await task_store.update(task_id, TaskStatus.PROCESSING, stage='run')
+    logger.debug("Posting signals data")
+    await upstream_client.request(
+        "POST", RUN_URL, stage='run', idempotent=False, json=systems, cookies=cookies
+    )
+    
+    await task_store.update(task_id, TaskStatus.PROCESSING, stage='result')
+    logger.debug("Retrieving result from server")
+    save_path = result_cache.get_path(cache_key)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    await upstream_client.download(RESULT_URL, save_path, stage='result', cookies=cookies)
+    logger.info("Result file downloaded successfully")
+    await asyncio.to_thread(result_cache.put, cache_key, parser, systems)
+    return save_path
@@ -0,0 +1,312 @@
+from config import logger
+
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+
+import gzip
+import numpy as np
+
+# уровень модуля задается через LOG_LEVELS
+logger = logger.get_child(__name__)
+
+GPS_EPOCH = datetime(1980, 1, 6)
+SECONDS_IN_WEEK = 604800
+# BDT отстает от GPST на 14 с, неделя BDT 0 - неделя GPS 1356
+BDS_WEEK_OFFSET = 1356
+BDS_TIME_OFFSET = 14
+# GPST - UTC, если в навигационном файле нет LEAP SECONDS
+DEFAULT_LEAP_SECONDS = 18
+
+# Гравитационный параметр (м^3/с^2) и скорость вращения Земли (рад/с) по ИКД систем
+KEPLER_CONSTANTS = {
+    'G': (3.986005e14, 7.2921151467e-5),
+    'J': (3.986005e14, 7.2921151467e-5),
+    'E': (3.986004418e14, 7.2921151467e-5),
+    'C': (3.986004418e14, 7.292115e-5),
+}
+# ПЗ-90: гравитационный параметр, экваториальный радиус, J2, скорость вращения Земли
+GLONASS_CONSTANTS = (3.9860044e14, 6378136.0, 1.0826257e-3, 7.292115e-5)
+# Геостационарные спутники BeiDou, их эфемериды заданы в повернутой системе
+BDS_GEO_NUMBERS = set(range(1, 6)) | set(range(59, 64))
+BDS_GEO_INCLINATION = np.radians(-5.0)
+
+# Наибольшая разница времени эпохи и эфемериды, с
+EPHEMERIS_MAX_AGE = {'G': 4 * 3600, 'J': 4 * 3600, 'E': 4 * 3600, 'C': 4 * 3600, 'R': 3600}
+KEPLER_ITERATIONS = 6
+GLONASS_STEP = 60
+# Положения считаются в узлах через NODE_STEP секунд и интерполируются кубически,
+# ошибка интерполяции для орбит ГНСС - сантиметры
+NODE_STEP = 120
+
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+
+class GeometryProvider(ABC):
+    """Положение спутников относительно станции в эпохи наблюдений.
+
+    get_geometry возвращает углы места и азимуты в градусах формы
+    (число спутников, число эпох), NaN - положение спутника неизвестно.
+    Время эпох - секунды от начала суток первого наблюдения.
+    """
+
+    @abstractmethod
+    def get_geometry(self, satellites: list, seconds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class BroadcastGeometry(GeometryProvider):
+    """Углы места и азимуты по бортовым эфемеридам навигационного файла RINEX 3.
+
+    Положения GPS, Galileo, BeiDou и QZSS считаются по кеплеровым элементам,
+    ГЛОНАСС - интегрированием уравнений движения методом Рунге-Кутты от
+    ближайшей эфемериды, сразу для всех спутников и эпох. Время эпох - GPST,
+    задержка распространения сигнала не учитывается.
+    """
+
+    def __init__(self, nav_path: str, position: tuple, day: date):
+        self.position = np.array(position, dtype=float)
+        self.rotation = _get_enu_rotation(self.position)
+        # начало суток в секундах GPST от эпохи GPS
+        self.day_start = (datetime(day.year, day.month, day.day) - GPS_EPOCH).total_seconds()
+        self.ephemerides, self.leap_seconds = read_navigation(nav_path)
+        logger.info("Loaded %d satellite ephemerides from %s", len(self.ephemerides), nav_path)
+
+    def get_geometry(self, satellites: list, seconds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        seconds = np.asarray(seconds, dtype=float)
+        if not len(seconds):
+            return np.empty((len(satellites), 0)), np.empty((len(satellites), 0))
+
+        # эпохи обрабатываются по возрастанию, тогда узлы каждой эпохи берутся через repeat
+        order = np.argsort(seconds, kind='stable') if np.any(np.diff(seconds) < 0) else None
+        if order is not None:
+            seconds = seconds[order]
+
+        first = np.floor(seconds[0] / NODE_STEP) - 1
+        intervals = int(np.floor(seconds[-1] / NODE_STEP) - first)
+        nodes = (first + np.arange(intervals + 3)) * NODE_STEP
+        local = (self.get_positions(satellites, nodes) - self.position) @ self.rotation.T
+        local = np.moveaxis(local, -1, 0).astype(np.float32)
+
+        # кубический многочлен Лагранжа по четырем соседним узлам в форме Горнера,
+        # точности float32 хватает на доли угловой секунды
+        previous, current, following, last = (local[..., shift:shift + intervals] for shift in range(4))
+        coefficients = (
+            (last - previous) / 6 + (current - following) / 2,
+            (previous + following) / 2 - current,
+            following - previous / 3 - current / 2 - last / 6,
+            current,
+        )
+        offset = seconds / NODE_STEP - first
+        index = np.floor(offset).astype(np.int64)
+        counts = np.bincount(index - 1, minlength=intervals)
+        u = (offset - index).astype(np.float32)
+        east, north, up = (_interpolate(coefficients, axis, counts, u) for axis in range(3))
+
+        horizontal = np.sqrt(east * east + north * north)
+        elevations = np.degrees(np.arctan2(up, horizontal, out=up), out=up)
+        azimuths = np.degrees(np.arctan2(east, north, out=east), out=east)
+        np.add(azimuths, 360, out=azimuths, where=azimuths < 0)
+        if order is not None:
+            elevations[:, order], azimuths[:, order] = elevations.copy(), azimuths.copy()
+        return elevations, azimuths
+
+    def get_positions(self, satellites: list, seconds: np.ndarray) -> np.ndarray:
+        """Координаты ECEF спутников в метрах формы (число спутников, число эпох, 3)."""
+        times = self.day_start + np.asarray(seconds, dtype=float)
+        positions = np.full((len(satellites), len(times), 3), np.nan)
+
+        by_system = {}
+        for index, satellite in enumerate(satellites):
+            if satellite in self.ephemerides:
+                by_system.setdefault(satellite[0], []).append(index)
+        for system, indexes in by_system.items():
+            # эфемериды ГЛОНАСС привязаны к UTC
+            system_times = times - self.leap_seconds if system == 'R' else times
+            parameters, ages = zip(*(self.__select(satellites[index], system_times) for index in indexes))
+            parameters, ages = np.stack(parameters), np.stack(ages)
+            if system == 'R':
+                computed = _glonass_positions(parameters, ages)
+            else:
+                geo = np.array([system == 'C' and int(satellites[index][1:]) in BDS_GEO_NUMBERS for index in indexes])
+                computed = _kepler_positions(parameters, ages, *KEPLER_CONSTANTS[system], geo[:, None])
+            computed[np.abs(ages) > EPHEMERIS_MAX_AGE[system]] = np.nan
+            positions[indexes] = computed
+        return positions
+
+    def __select(self, satellite: str, times: np.ndarray):
+        # ближайшая по времени эфемерида для каждой эпохи
+        reference, parameters = self.ephemerides[satellite]
+        after = np.minimum(np.searchsorted(reference, times), len(reference) - 1)
+        before = np.maximum(after - 1, 0)
+        nearest = np.where(np.abs(times - reference[before]) <= np.abs(reference[after] - times), before, after)
+        return parameters[nearest], times - reference[nearest]
+
+
+def read_navigation(path: str) -> tuple[dict, int]:
+    """Эфемериды навигационного файла RINEX 3 и разница GPST - UTC.
+
+    Для каждого спутника возвращаются отсортированные времена эфемерид в
+    секундах GPST от эпохи GPS (toe, у ГЛОНАСС - tb в UTC) и строки
+    параметров в порядке файла после поправок часов.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        lines = f.read().splitlines()
+
+    leap_seconds = DEFAULT_LEAP_SECONDS
+    body = 0
+    for body, line in enumerate(lines, start=1):
+        label = line[60:].strip()
+        if label == "LEAP SECONDS" and line[:6].strip():
+            leap_seconds = int(line[:6])
+        elif label == "END OF HEADER":
+            break
+
+    records = {}
+    satellite = None
+    for line in lines[body:]:
+        if not line.strip():
+            continue
+        if line[0] != ' ':
+            satellite = line[:3].replace(' ', '0') if line[0] in 'GRECJ' else None
+            if satellite is None:
+                continue
+            epoch = datetime(*(int(field) for field in line[4:23].split()))
+            values = [line[23 + 19 * k:42 + 19 * k] for k in range(3)]
+            records.setdefault(satellite, []).append((epoch, values))
+        elif satellite is not None:
+            values.extend(line[4 + 19 * k:23 + 19 * k] for k in range(4))
+
+    ephemerides = {}
+    for satellite, satellite_records in records.items():
+        width = max(len(values) for _, values in satellite_records)
+        parameters = np.array([
+            [_parse_float(value) for value in values] + [np.nan] * (width - len(values))
+            for _, values in satellite_records
+        ])
+        if satellite[0] == 'R':
+            reference = np.array([(epoch - GPS_EPOCH).total_seconds() for epoch, _ in satellite_records])
+        else:
+            week = parameters[:, 21] + (BDS_WEEK_OFFSET if satellite[0] == 'C' else 0)
+            reference = week * SECONDS_IN_WEEK + parameters[:, 11] + (BDS_TIME_OFFSET if satellite[0] == 'C' else 0)
+        valid = np.isfinite(reference)
+        order = np.argsort(reference[valid], kind='stable')
+        if len(order):
+            ephemerides[satellite] = (reference[valid][order], parameters[valid][order])
+    return ephemerides, leap_seconds
+
+
+def _parse_float(value: str) -> float:
+    value = value.strip()
+    return float(value.replace('D', 'E').replace('d', 'e')) if value else np.nan
+
+
+def _interpolate(coefficients: tuple, axis: int, counts: np.ndarray, u: np.ndarray) -> np.ndarray:
+    # коэффициенты интервала повторяются для всех его эпох
+    values = np.repeat(coefficients[0][axis], counts, axis=1)
+    for coefficient in coefficients[1:]:
+        values *= u
+        values += np.repeat(coefficient[axis], counts, axis=1)
+    return values
+
+
+def _kepler_positions(p: np.ndarray, tk: np.ndarray, mu: float, omega_e: float, geo: np.ndarray) -> np.ndarray:
+    """Положения по кеплеровым элементам через tk секунд от toe, p[..., k] - параметры записи."""
+    a = p[..., 10] ** 2
+    e = p[..., 8]
+    mean_anomaly = p[..., 6] + (np.sqrt(mu / a ** 3) + p[..., 5]) * tk
+    anomaly = mean_anomaly.copy()
+    for _ in range(KEPLER_ITERATIONS):
+        anomaly -= (anomaly - e * np.sin(anomaly) - mean_anomaly) / (1 - e * np.cos(anomaly))
+
+    latitude = np.arctan2(np.sqrt(1 - e ** 2) * np.sin(anomaly), np.cos(anomaly) - e) + p[..., 17]
+    sin2, cos2 = np.sin(2 * latitude), np.cos(2 * latitude)
+    latitude = latitude + p[..., 9] * sin2 + p[..., 7] * cos2
+    radius = a * (1 - e * np.cos(anomaly)) + p[..., 4] * sin2 + p[..., 16] * cos2
+    inclination = p[..., 15] + p[..., 19] * tk + p[..., 14] * sin2 + p[..., 12] * cos2
+
+    # у геостационарных BeiDou долгота узла задается в инерциальной системе
+    toe = p[..., 11]
+    node = p[..., 13] + p[..., 18] * tk - omega_e * toe - np.where(geo, 0.0, omega_e * tk)
+    x, y = radius * np.cos(latitude), radius * np.sin(latitude)
+    positions = np.stack((
+        x * np.cos(node) - y * np.cos(inclination) * np.sin(node),
+        x * np.sin(node) + y * np.cos(inclination) * np.cos(node),
+        y * np.sin(inclination),
+    ), axis=-1)
+
+    if np.any(geo):
+        rotation = omega_e * tk
+        gx, gy, gz = positions[..., 0], positions[..., 1], positions[..., 2]
+        gy, gz = (
+            gy * np.cos(BDS_GEO_INCLINATION) + gz * np.sin(BDS_GEO_INCLINATION),
+            -gy * np.sin(BDS_GEO_INCLINATION) + gz * np.cos(BDS_GEO_INCLINATION),
+        )
+        rotated = np.stack((
+            gx * np.cos(rotation) + gy * np.sin(rotation),
+            -gx * np.sin(rotation) + gy * np.cos(rotation),
+            gz,
+        ), axis=-1)
+        positions = np.where(geo[..., None], rotated, positions)
+    return positions
+
+
+def _glonass_positions(p: np.ndarray, dt: np.ndarray) -> np.ndarray:
+    """Положения ГЛОНАСС через dt секунд от tb, p[..., k] - параметры записи в км."""
+    state = tuple(p[..., k] * 1000 for k in (3, 7, 11, 4, 8, 12))
+    acceleration = tuple(p[..., k] * 1000 for k in (5, 9, 13))
+
+    steps = max(1, int(np.ceil(np.nanmax(np.abs(dt), initial=0) / GLONASS_STEP)))
+    h = dt / steps
+    for _ in range(steps):
+        k1 = _glonass_derivative(state, acceleration)
+        k2 = _glonass_derivative(tuple(s + h / 2 * k for s, k in zip(state, k1)), acceleration)
+        k3 = _glonass_derivative(tuple(s + h / 2 * k for s, k in zip(state, k2)), acceleration)
+        k4 = _glonass_derivative(tuple(s + h * k for s, k in zip(state, k3)), acceleration)
+        state = tuple(
+            s + h / 6 * (d1 + 2 * d2 + 2 * d3 + d4)
+            for s, d1, d2, d3, d4 in zip(state, k1, k2, k3, k4)
+        )
+    return np.stack(state[:3], axis=-1)
+
+
+def _glonass_derivative(state: tuple, acceleration: tuple) -> tuple:
+    # уравнения движения в ПЗ-90 с учетом J2 и вращения Земли, лунно-солнечное
+    # ускорение из эфемериды считается постоянным
+    mu, radius, j2, omega_e = GLONASS_CONSTANTS
+    x, y, z, vx, vy, vz = state
+    r2 = x * x + y * y + z * z
+    r3 = r2 * np.sqrt(r2)
+    gravity = mu / r3
+    c = 1.5 * j2 * mu * radius ** 2 / (r2 * r3)
+    z2 = 5 * z * z / r2
+    return (
+        vx,
+        vy,
+        vz,
+        -gravity * x - c * x * (1 - z2) + omega_e ** 2 * x + 2 * omega_e * vy + acceleration[0],
+        -gravity * y - c * y * (1 - z2) + omega_e ** 2 * y - 2 * omega_e * vx + acceleration[1],
+        -gravity * z - c * z * (3 - z2) + acceleration[2],
+    )
+
+
+def _get_enu_rotation(position: np.ndarray) -> np.ndarray:
+    """Матрица перехода от ECEF к локальным east, north, up для точки WGS84."""
+    x, y, z = position
+    e2 = WGS84_F * (2 - WGS84_F)
+    p = np.hypot(x, y)
+    latitude = np.arctan2(z, p * (1 - e2))
+    for _ in range(5):
+        n = WGS84_A / np.sqrt(1 - e2 * np.sin(latitude) ** 2)
+        height = p / np.cos(latitude) - n
+        latitude = np.arctan2(z, p * (1 - e2 * n / (n + height)))
+    longitude = np.arctan2(y, x)
+
+    sin_lat, cos_lat = np.sin(latitude), np.cos(latitude)
+    sin_lon, cos_lon = np.sin(longitude), np.cos(longitude)
+    return np.array([
+        [-sin_lon, cos_lon, 0.0],
+        [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat],
+        [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat],
+    ])
@@ -0,0 +1,139 @@
+import numpy as np
+
+from config import ELEVATION
+
+
+def find_holes_in_matrix(data: np.ndarray, signals: list, period_records: int, elevation: int|float = ELEVATION):
+    """Векторный подсчет дыр по периодам.
+
+    Воспроизводит построчный автомат старой реализации find_holes:
+    каждая строка относится к одной из веток (начало сеанса, разрыв по TSN,
+    частичное отсутствие сигналов, потенциальная дыра, конец сеанса),
+    после чего вклады строк суммируются по периодам через bincount.
+    Возвращает словарь signal -> np.ndarray длиной в число периодов.
+    """
+    return aggregate_holes(find_hole_events(data, elevation), signals, period_records)
+
+
+def find_hole_events(data: np.ndarray, elevation: int|float = ELEVATION) -> dict:
+    """Вклады строк в дыры, не зависящие от длины периода.
+
+    Результат можно сохранить и затем получить дыры для любого периода
+    через aggregate_holes без повторного разбора строк.
+    """
+    rows_count = len(data)
+    row_ids = np.arange(rows_count)
+
+    tsn = data[:, 0]
+    elev = data[:, 2]
+    datas = data[:, 4:]
+
+    all_zero = np.all(datas == 0, axis=1)
+    any_positive = np.any(datas > 0, axis=1)
+    any_zero = np.any(datas == 0, axis=1)
+    all_positive = np.all(datas > 0, axis=1)
+
+    prev_tsn = np.concatenate(([0.0], tsn[:-1]))
+    gap = prev_tsn + 1 < tsn
+    jump = np.trunc(tsn).astype(np.int64) - np.trunc(prev_tsn).astype(np.int64)
+
+    # Состояние "сеанс передачи начат" после обработки строки:
+    # включается любой строкой с данными, выключается пустой строкой на низком угле
+    period_end = all_zero & (elev < elevation)
+    state_rows = np.maximum.accumulate(np.where(any_positive | period_end, row_ids, -1))
+    started_after = np.where(state_rows >= 0, any_positive[np.maximum(state_rows, 0)], False)
+    started_before = np.concatenate(([False], started_after[:-1]))
+
+    no_send = ~started_before & all_zero
+    send_start = ~started_before & any_positive
+    tsn_gap = started_before & any_positive & gap
+    rest = ~no_send & ~tsn_gap
+    partial = rest & any_positive & any_zero
+    complete = rest & ~partial & all_positive
+    potencial = started_before & all_zero & (elev > elevation)
+    send_end = started_before & all_zero & ~(elev > elevation) & (elev < elevation)
+
+    # Счетчик records, по которому строки делятся на периоды
+    increments = (
+        1
+        + np.where((no_send | send_start) & gap, jump - 1, 0)
+        + np.where(tsn_gap, jump, 0)
+    )
+    records = np.cumsum(increments)
+    last_data_row = np.maximum.accumulate(np.where(any_positive, row_ids, -1))
+
+    # Потенциальные дыры переносятся в actual каждым разрывом по TSN до ближайшего
+    # сброса и еще раз самим сбросом, если это не конец сеанса
+    flush_rows = np.flatnonzero(partial | complete | send_end)
+    gap_flushes = np.cumsum(tsn_gap)
+    potencial_rows = np.flatnonzero(potencial)
+    next_flush = np.searchsorted(flush_rows, potencial_rows, side='right')
+    closing_rows = np.append(flush_rows, rows_count)[next_flush]
+    closes_with_add = np.append(partial | complete, True)[closing_rows]
+    potencial_weight = np.zeros(rows_count, dtype=np.int64)
+    potencial_weight[potencial_rows] = (
+        gap_flushes[closing_rows - 1] - gap_flushes[potencial_rows] + closes_with_add
+    )
+
+    common = np.where(send_start, 1, 0) + np.where(tsn_gap, jump, 0) + potencial_weight
+
+    return {
+        'records': records.astype(np.int64),
+        'started_after': started_after,
+        'send_end': send_end,
+        'last_data_row': last_data_row,
+        'common': common.astype(np.int64),
+        'partial_zeros': partial[:, None] & (datas == 0),
+    }
+
+
+def aggregate_holes(events: dict, signals: list, period_records: int) -> dict:
+    """Дыры по периодам из вкладов строк find_hole_events."""
+    records = events['records']
+    rows_count = len(records)
+    row_ids = np.arange(rows_count)
+
+    periods = _period_numbers(records, period_records)
+    row_periods = np.concatenate(([0], periods[:-1]))
+    periods_count = int(periods[-1]) + 1 if rows_count else 1
+
+    # Начальное значение периода: -1 у первого, у остальных зависит от состояния
+    # сеанса в строке, на которой период был открыт
+    base = np.full(periods_count, -1, dtype=np.int64)
+    if periods_count > 1:
+        opening_rows = np.searchsorted(periods, np.arange(1, periods_count), side='left')
+        base[1:] = np.where(events['started_after'][opening_rows], 0, -1)
+
+    # Конец сеанса в периоде без данных перезаписывает значение периода на -1
+    window_start = np.searchsorted(row_periods, row_periods, side='left')
+    reset_rows = np.flatnonzero(events['send_end'] & (events['last_data_row'] < window_start))
+    last_reset = np.full(periods_count, -1, dtype=np.int64)
+    np.maximum.at(last_reset, row_periods[reset_rows], reset_rows)
+    base[last_reset >= 0] = -1
+    included = row_ids > last_reset[row_periods]
+
+    common = np.where(included, events['common'], 0)
+    common_sums = np.bincount(row_periods, weights=common, minlength=periods_count)
+    common_sums = np.rint(common_sums).astype(np.int64)
+
+    partial_zeros = events['partial_zeros'] & included[:, None]
+    holes = {}
+    for column, signal in enumerate(signals):
+        zero_sums = np.bincount(row_periods[partial_zeros[:, column]], minlength=periods_count)
+        holes[signal] = base + common_sums + zero_sums
+    return holes
+
+
+def _period_numbers(records: np.ndarray, period_records: int) -> np.ndarray:
+    """Номер последнего открытого периода после каждой строки.
+
+    Старый цикл открывал новые периоды только при records > period_records,
+    поэтому при records, кратном period_records, результат зависит от предыдущей строки.
+    """
+    periods = records // period_records
+    multiple_rows = np.flatnonzero(records % period_records == 0)
+    for row in multiple_rows:
+        previous = periods[row - 1] if row > 0 else 0
+        if previous >= periods[row] - 1:
+            periods[row] -= 1
+    return periods
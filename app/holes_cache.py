@@ -0,0 +1,85 @@
+from config import ELEVATION, HOLES_CACHE_ENABLED, logger
+from holes import find_hole_events
+from metrics import count_cache
+from parsers.satellite_parser import SatelliteParser
+
+from typing import Optional
+
+import json
+import os
+import numpy as np
+
+# уровень модуля задается через LOG_LEVELS
+logger = logger.get_child(__name__)
+
+# Меняется вместе с составом вкладов find_hole_events, чтобы старые файлы не читались
+HOLES_EVENTS_VERSION = 1
+
+
+class HolesCache:
+    """Вклады строк в дыры рядом с файлом спутника (<file>.holes.npz).
+
+    Вклады не зависят от длины периода, поэтому повторный запрос с другим
+    data_period только агрегирует их по периодам и не разбирает строки заново.
+    Файл кэша сбрасывается при изменении файла спутника или угла отсечки.
+    """
+
+    def __init__(self, enabled: bool = HOLES_CACHE_ENABLED, elevation: int|float = ELEVATION):
+        self.enabled = enabled
+        self.elevation = elevation
+
+    @staticmethod
+    def get_path(file: str) -> str:
+        return f"{file}.holes.npz"
+
+    def get_events(self, satellite: SatelliteParser) -> tuple[dict, bool]:
+        """Вклады строк файла спутника и признак попадания в кэш."""
+        # полный путь: имя файла одинаково у одного спутника в разных задачах
+        file = satellite.get_filepath()
+        if self.enabled:
+            key = self.__get_key(file)
+            events = self.__load(file, key)
+            if events is not None:
+                logger.debug("Hole events loaded from cache for file %s", file)
+                count_cache('holes', True)
+                return events, True
+            count_cache('holes', False)
+
+        events = find_hole_events(satellite.get_data(), self.elevation)
+        if self.enabled:
+            self.__save(file, key, events)
+        return events, False
+
+    def __get_key(self, file: str) -> str:
+        stat = os.stat(file)
+        return json.dumps({
+            'version': HOLES_EVENTS_VERSION,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'elevation': self.elevation,
+        })
+
+    def __load(self, file: str, key: str) -> Optional[dict]:
+        try:
+            with np.load(self.get_path(file)) as cached:
+                if str(cached['key']) != key:
+                    logger.debug("Hole events cache is outdated for file %s", file)
+                    return None
+                return {name: cached[name] for name in cached.files if name != 'key'}
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("Hole events cache is not available for file %s: %s", file, e)
+            return None
+
+    def __save(self, file: str, key: str, events: dict):
+        path = self.get_path(file)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            # атомарная замена, чтобы параллельные процессы пула не прочитали недописанный файл
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, key=np.array(key), **events)
+            os.replace(tmp_path, path)
+            logger.debug("Saved hole events cache for file %s", file)
+        except OSError as e:
+            logger.warning("Failed to save hole events cache for file %s: %s", file, e)
+
+holes_cache = HolesCache()
@@ -0,0 +1,158 @@
+from config import JOB_VISIBILITY_TIMEOUT, logger, redis_async_client
+
+from typing import Optional
+
+import time
+
+PENDING_KEY = "jobs:pending"
+LEASES_KEY = "jobs:leases"
+DELAYED_KEY = "jobs:delayed"
+DEAD_KEY = "jobs:dead"
+# Номер попытки по задачам. Отдельный хэш, а не поле job:<id>, потому что скрипт
+# взятия задачи обращается только к ключам, переданным в KEYS, а id задачи до RPOP неизвестен
+ATTEMPTS_KEY = "jobs:attempts"
+
+# Взятие задачи из очереди, выдача аренды и счет попыток одним шагом,
+# чтобы упавший между ними воркер не оставил задачу без аренды
+CLAIM_SCRIPT = """
+local job_id = redis.call('RPOP', KEYS[1])
+if not job_id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+local attempts = redis.call('HINCRBY', KEYS[3], job_id, 1)
+return {job_id, attempts}
+"""
+
+# Аренда принадлежит воркеру, пока задача в jobs:leases и номер попытки не изменился:
+# после возврата в очередь и повторного взятия старый воркер ее уже не держит
+LEASE_CHECK = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] or not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+"""
+
+EXTEND_SCRIPT = LEASE_CHECK + """
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+return 1
+"""
+
+ACK_SCRIPT = LEASE_CHECK + """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[3])
+return 1
+"""
+
+RETRY_SCRIPT = LEASE_CHECK + """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[3], 'error', ARGV[4])
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[1])
+return 1
+"""
+
+DEAD_LETTER_SCRIPT = LEASE_CHECK + """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[3], 'error', ARGV[3])
+redis.call('LPUSH', KEYS[4], ARGV[1])
+return 1
+"""
+
+# Возврат в очередь задач с истекшей арендой и отложенных задач, срок которых наступил
+REQUEUE_SCRIPT = """
+local moved = 0
+for _, key in ipairs({KEYS[2], KEYS[3]}) do
+    local job_ids = redis.call('ZRANGEBYSCORE', key, '-inf', ARGV[1])
+    for _, job_id in ipairs(job_ids) do
+        redis.call('ZREM', key, job_id)
+        redis.call('LPUSH', KEYS[1], job_id)
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+
+class JobQueue:
+    """Очередь задач конвертации в Redis с арендой на время выполнения.
+
+    Воркер получает задачу вместе с арендой на visibility_timeout секунд и
+    продлевает ее, пока задача выполняется. Задачи с истекшей арендой
+    (воркер упал или был остановлен) возвращаются в очередь.
+    """
+
+    def __init__(self, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT):
+        self.visibility_timeout = visibility_timeout
+        self.__scripts = {}
+
+    async def enqueue(self, job_id: str):
+        async with redis_async_client.pipeline(transaction=True) as pipe:
+            pipe.hset(f"job:{job_id}", mapping={'enqueued_at': time.time()})
+            pipe.hset(ATTEMPTS_KEY, job_id, 0)
+            pipe.lpush(PENDING_KEY, job_id)
+            await pipe.execute()
+        logger.info(f"Job {job_id} enqueued")
+
+    async def claim(self) -> Optional[tuple[str, int]]:
+        """Задача и номер попытки, он же служит ключом аренды в остальных методах."""
+        claimed = await self.__run(
+            CLAIM_SCRIPT,
+            keys=[PENDING_KEY, LEASES_KEY, ATTEMPTS_KEY],
+            args=[time.time() + self.visibility_timeout],
+        )
+        if claimed is None:
+            return None
+        job_id, attempts = claimed
+        return job_id.decode(), int(attempts)
+
+    async def extend(self, job_id: str, attempts: int) -> bool:
+        """Продлевает аренду, False - аренда уже истекла и задача отдана другому."""
+        return await self.__release(EXTEND_SCRIPT, [], job_id, attempts, time.time() + self.visibility_timeout)
+
+    async def ack(self, job_id: str, attempts: int) -> bool:
+        acknowledged = await self.__release(ACK_SCRIPT, [f"job:{job_id}"], job_id, attempts)
+        if acknowledged:
+            logger.debug(f"Job {job_id} acknowledged")
+        return acknowledged
+
+    async def retry(self, job_id: str, attempts: int, delay: float, error: str) -> bool:
+        scheduled = await self.__release(
+            RETRY_SCRIPT, [f"job:{job_id}", DELAYED_KEY], job_id, attempts, time.time() + delay, error
+        )
+        if scheduled:
+            logger.warning(f"Job {job_id} will be retried in {delay:.1f} s: {error}")
+        return scheduled
+
+    async def dead_letter(self, job_id: str, attempts: int, error: str) -> bool:
+        moved = await self.__release(DEAD_LETTER_SCRIPT, [f"job:{job_id}", DEAD_KEY], job_id, attempts, error)
+        if moved:
+            logger.error(f"Job {job_id} moved to dead letter queue: {error}")
+        return moved
+
+    async def get_depth(self) -> dict:
+        """Число задач в очереди, в работе, отложенных и в очереди упавших."""
+        async with redis_async_client.pipeline(transaction=False) as pipe:
+            pipe.llen(PENDING_KEY)
+            pipe.zcard(LEASES_KEY)
+            pipe.zcard(DELAYED_KEY)
+            pipe.llen(DEAD_KEY)
+            pending, leased, delayed, dead = await pipe.execute()
+        return {'pending': pending, 'leased': leased, 'delayed': delayed, 'dead': dead}
+
+    async def requeue_expired(self) -> int:
+        moved = await self.__run(REQUEUE_SCRIPT, keys=[PENDING_KEY, LEASES_KEY, DELAYED_KEY], args=[time.time()])
+        if moved:
+            logger.info(f"{moved} jobs returned to the queue")
+        return moved
+
+    async def __release(self, script: str, keys: list, job_id: str, attempts: int, *args) -> bool:
+        # скрипты с LEASE_CHECK: первые ключи - аренды и попытки, первые аргументы - задача и попытка
+        done = await self.__run(script, keys=[LEASES_KEY, ATTEMPTS_KEY, *keys], args=[job_id, attempts, *args])
+        return bool(done)
+
+    async def __run(self, script: str, keys: list, args: list):
+        if script not in self.__scripts:
+            self.__scripts[script] = redis_async_client.register_script(script)
+        return await self.__scripts[script](keys=keys, args=args)
+
+job_queue = JobQueue()
@@ -0,0 +1,276 @@
+from config import LOCAL_CONVERSION_BLOCK_SIZE, logger
+from geometry import GeometryProvider
+from parsers.rinex_parser import RinexParser, HEADER_LABEL_START, HEADER_LABEL_END
+
+from datetime import date
+
+import os
+import numpy as np
+
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+SPACE = ord(' ')
+DOT = ord('.')
+MINUS = ord('-')
+EPOCH_MARK = ord('>')
+
+# Наблюдение в RINEX 3: значение F14.3, флаги LLI и силы сигнала по одному символу
+SATELLITE_ID_WIDTH = 3
+OBSERVATION_WIDTH = 16
+VALUE_WIDTH = 14
+
+# Ширина и число знаков после запятой колонок tsn, hour, el, az и сигналов
+POSITION_FORMATS = [(8, 0), (13, 8), (10, 4), (10, 4)]
+SIGNAL_FORMAT = (16, 3)
+# Угол места спутника, положение которого неизвестно: ниже горизонта
+UNKNOWN_ELEVATION = -90.0
+
+
+class LocalConverter:
+    """Преобразование наблюдений RINEX 3 в файлы спутников без сервиса конвертации.
+
+    Тело файла читается блоками, граница блока всегда совпадает с началом
+    эпохи. Значения наблюдений разбираются по фиксированным позициям сразу
+    для всех строк блока. Для каждого спутника пишется файл с колонками
+    tsn, hour, el, az и сигналами системы из parser.get_systems(), как в
+    результатах сервиса. Строки пишутся для эпох, в которые спутник наблюдался
+    или был выше горизонта, углы берутся у geometry.
+    """
+
+    def __init__(self, parser: RinexParser, geometry: GeometryProvider, block_size: int = LOCAL_CONVERSION_BLOCK_SIZE):
+        self.parser = parser
+        self.geometry = geometry
+        self.block_size = block_size
+        self.date = parser.get_date()
+        self.timestep = parser.get_timestep()
+        # тип наблюдений системы по первой букве: G -> ['C1C', 'L1C', ...]
+        self.types = {
+            key[0].upper(): list(types)
+            for key, types in parser.get_systems().items()
+            if key.endswith('_signals')
+        }
+        self.files = {}
+        self.epochs = []
+
+    def get_filename(self, satellite: str) -> str:
+        yday = str(self.date.timetuple().tm_yday).zfill(3)
+        radar = self.parser.get_radar_name().lower()
+        return f'{radar}_{satellite}_{yday}_{self.date.year%100}.dat'
+
+    def convert(self, folder: str) -> list:
+        """Пишет файлы спутников в folder и возвращает их пути."""
+        rinex_path = self.parser.get_rinex_filepath()
+        logger.info(f"Converting {rinex_path} locally into {folder}")
+        try:
+            with open(rinex_path, 'rb') as f:
+                for line in f:
+                    if line[HEADER_LABEL_START:HEADER_LABEL_END].strip() == b"END OF HEADER":
+                        break
+                for block in self.__read_blocks(f):
+                    self.__convert_block(block, folder)
+        finally:
+            for file in self.files.values():
+                file.close()
+
+        paths = [file.name for file in self.files.values()]
+        logger.info(f"Local conversion finished: {len(paths)} satellites, {sum(len(e) for e in self.epochs)} epochs")
+        return paths
+
+    def __read_blocks(self, f):
+        remainder = b''
+        while True:
+            chunk = f.read(self.block_size)
+            block = remainder + chunk
+            if chunk:
+                # последняя эпоха блока может быть неполной, она переходит в следующий
+                cut = block.rfind(b'\n>')
+                if cut < 0:
+                    remainder = block
+                    continue
+                block, remainder = block[:cut + 1], block[cut + 1:]
+            elif block and not block.endswith(b'\n'):
+                block += b'\n'
+            if block:
+                yield block
+            if not chunk:
+                return
+
+    def __convert_block(self, block: bytes, folder: str):
+        data = np.frombuffer(block, dtype=np.uint8)
+        ends = np.flatnonzero(data == NEWLINE)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        ends = ends - (data[np.maximum(ends - 1, 0)] == CARRIAGE_RETURN)
+        lengths = ends - starts
+        first = np.where(lengths > 0, data[np.minimum(starts, len(data) - 1)], 0)
+
+        seconds, line_epochs, skipped = self.__parse_epochs(block, starts, ends, first)
+        observations = (first != EPOCH_MARK) & ~skipped & (line_epochs >= 0) & (lengths >= SATELLITE_ID_WIDTH)
+        self.epochs.append(seconds)
+
+        tens = data[np.minimum(starts + 1, len(data) - 1)]
+        ones = data[np.minimum(starts + 2, len(data) - 1)]
+        numbers = np.where(tens == SPACE, 0, tens.astype(np.int64) - 48) * 10 + ones.astype(np.int64) - 48
+
+        observed = {}
+        for system, types in self.types.items():
+            rows = np.flatnonzero(observations & (first == ord(system)))
+            if not len(rows):
+                continue
+            values = _parse_observations(data, starts[rows], ends[rows], len(types))
+            for number in np.unique(numbers[rows]):
+                selected = numbers[rows] == number
+                satellite = f"{system}{number:02d}"
+                signals = np.zeros((len(seconds), len(types)))
+                signals[line_epochs[rows[selected]]] = values[selected]
+                observed[satellite] = signals
+
+        new_satellites = [satellite for satellite in observed if satellite not in self.files]
+        for satellite in new_satellites:
+            self.__open(satellite, folder)
+
+        satellites = list(self.files)
+        if not satellites or not len(seconds):
+            return
+        elevations, azimuths = self.__get_geometry(satellites, seconds)
+        for index, satellite in enumerate(satellites):
+            signals = observed.get(satellite)
+            if signals is None:
+                signals = np.zeros((len(seconds), len(self.types[satellite[0]])))
+            self.__write(satellite, seconds, elevations[index], azimuths[index], signals)
+
+    def __parse_epochs(self, block: bytes, starts: np.ndarray, ends: np.ndarray, first: np.ndarray):
+        # номер эпохи блока для каждой строки, -1 у строк событий и до первой эпохи
+        epoch_rows = np.flatnonzero(first == EPOCH_MARK)
+        skipped = np.zeros(len(starts), dtype=bool)
+        epoch_numbers = np.full(len(epoch_rows), -1)
+        seconds = []
+        for index, row in enumerate(epoch_rows):
+            fields = block[starts[row] + 1:ends[row]].split()
+            flag, count = int(fields[6]), int(fields[7])
+            if flag > 1:
+                # флаги событий: следующие count строк - не наблюдения
+                skipped[row + 1:row + 1 + count] = True
+                continue
+            year, month, day, hour, minute = (int(field) for field in fields[:5])
+            days = (date(year, month, day) - self.date).days
+            epoch_numbers[index] = len(seconds)
+            seconds.append(days * 86400 + hour * 3600 + minute * 60 + float(fields[5]))
+
+        line_epochs = np.cumsum(first == EPOCH_MARK) - 1
+        line_epochs = np.where(line_epochs >= 0, epoch_numbers[np.maximum(line_epochs, 0)], -1)
+        return np.array(seconds), line_epochs, skipped
+
+    def __open(self, satellite: str, folder: str):
+        columns = ['tsn', 'hour', 'el', 'az'] + self.types[satellite[0]]
+        file = open(os.path.join(folder, self.get_filename(satellite)), 'wb')
+        file.write(f"# Site: {self.parser.get_radar_name()}\n".encode())
+        file.write(f"# Satellite: {satellite}\n".encode())
+        file.write(f"# Columns: {' '.join(columns)}\n".encode())
+        file.write(f"{' '.join(columns)}\n".encode())
+        self.files[satellite] = file
+
+        # эпохи предыдущих блоков, в которые спутник был выше горизонта
+        previous = np.concatenate(self.epochs[:-1]) if len(self.epochs) > 1 else np.empty(0)
+        if len(previous):
+            elevations, azimuths = self.__get_geometry([satellite], previous)
+            signals = np.zeros((len(previous), len(columns) - 4))
+            self.__write(satellite, previous, elevations[0], azimuths[0], signals)
+
+    def __get_geometry(self, satellites: list, seconds: np.ndarray):
+        elevations, azimuths = self.geometry.get_geometry(satellites, seconds)
+        unknown = np.isnan(elevations) | np.isnan(azimuths)
+        return np.where(unknown, UNKNOWN_ELEVATION, elevations), np.where(unknown, 0.0, azimuths)
+
+    def __write(self, satellite: str, seconds: np.ndarray, elevations: np.ndarray, azimuths: np.ndarray, signals: np.ndarray):
+        keep = np.any(signals != 0, axis=1) | (elevations > 0)
+        if not keep.any():
+            return
+        columns = np.column_stack((
+            np.rint(seconds / self.timestep),
+            seconds / 3600,
+            elevations,
+            azimuths,
+            signals,
+        ))[keep]
+        formats = POSITION_FORMATS + [SIGNAL_FORMAT] * signals.shape[1]
+        self.files[satellite].write(_format_rows(columns, formats))
+
+
+def _parse_observations(data: np.ndarray, starts: np.ndarray, ends: np.ndarray, count: int) -> np.ndarray:
+    """Значения count наблюдений строк, пустые поля и недописанные строки дают 0."""
+    offsets = (
+        SATELLITE_ID_WIDTH
+        + OBSERVATION_WIDTH * np.arange(count)[:, None]
+        + np.arange(VALUE_WIDTH)[None, :]
+    ).ravel()
+    positions = starts[:, None] + offsets[None, :]
+    chars = data[np.minimum(positions, len(data) - 1)]
+    chars[positions >= ends[:, None]] = SPACE
+    chars = chars.reshape(len(starts), count, VALUE_WIDTH)
+
+    digits = chars - np.uint8(48)
+    digits[digits > 9] = 0
+    has_dot = chars == DOT
+    dot = np.where(has_dot.any(axis=2), has_dot.argmax(axis=2), VALUE_WIDTH)
+
+    # в F14.3 точка всегда на одном месте, иначе вес цифры зависит от положения точки
+    standard_dot = VALUE_WIDTH - 4
+    if np.all((dot == standard_dot) | (dot == VALUE_WIDTH) & ~digits.any(axis=2)):
+        values = digits.astype(np.float64) @ _get_weights(standard_dot)
+    else:
+        index = np.arange(VALUE_WIDTH)
+        exponent = np.where(index < dot[..., None], dot[..., None] - 1 - index, dot[..., None] - index)
+        values = np.sum(digits * 10.0 ** exponent, axis=2)
+    return np.where((chars == MINUS).any(axis=2), -values, values)
+
+
+def _get_weights(dot: int) -> np.ndarray:
+    index = np.arange(VALUE_WIDTH)
+    return np.where(index < dot, 10.0 ** (dot - 1 - index), 10.0 ** (dot - index)) * (index != dot)
+
+
+def _format_rows(columns: np.ndarray, formats: list) -> bytes:
+    """Строки с колонками фиксированной ширины, каждая колонка начинается с пробела."""
+    parts = [
+        _format_fixed(columns[:, index], column_width, decimals)
+        for index, (column_width, decimals) in enumerate(formats[:len(POSITION_FORMATS)])
+    ]
+    # колонки сигналов одного формата форматируются вместе
+    signals = _format_fixed(columns[:, len(POSITION_FORMATS):], *SIGNAL_FORMAT)
+    parts.append(signals.reshape(len(columns), -1))
+    parts.append(np.full((len(columns), 1), NEWLINE, dtype=np.uint8))
+    return np.concatenate(parts, axis=1).tobytes()
+
+
+def _format_fixed(values: np.ndarray, width: int, decimals: int) -> np.ndarray:
+    """Символы значений в поле ширины width, форма (*values.shape, width)."""
+    scaled = np.rint(np.abs(values) * 10 ** decimals).astype(np.int64)
+    negative = (values < 0) & (scaled > 0)
+    chars = np.full(values.shape + (width,), SPACE, dtype=np.uint8)
+
+    position = width - 1
+    for _ in range(decimals):
+        chars[..., position] = 48 + scaled % 10
+        scaled //= 10
+        position -= 1
+    if decimals:
+        chars[..., position] = DOT
+        position -= 1
+
+    # целая часть из хотя бы одной цифры, первый символ поля остается пробелом
+    chars[..., position] = 48 + scaled % 10
+    scaled //= 10
+    leading = np.full(values.shape, position)
+    position -= 1
+    while position >= 1 and scaled.any():
+        has_digit = scaled > 0
+        chars[..., position] = np.where(has_digit, 48 + scaled % 10, SPACE)
+        leading = np.where(has_digit, position, leading)
+        scaled //= 10
+        position -= 1
+
+    if scaled.any() or np.any(leading[negative] < 2):
+        raise ValueError(f"Value does not fit into column of width {width}")
+    sign = np.where(negative, leading - 1, 0)
+    np.put_along_axis(chars, sign[..., None], np.where(negative, MINUS, chars[..., 0])[..., None], axis=-1)
+    return chars
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, UploadFile, BackgroundTasks, HTTPException, File, Form, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, BackgroundTasks, HTTPException, File, Form, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from functions import *
 from config import *
@@ -7,9 +7,33 @@ import uuid
 import json
 import asyncio
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
 
-from parsers.satellite_parser import SatelliteParser
 from parsers.parser_manager import ParserManager, get_parser_manager
+from upstream_client import upstream_client
+from task_store import task_store, TaskStatus
+from job_queue import job_queue
+from metrics import QUEUE_DEPTH, REQUEST_DURATION, count_bytes, render_metrics, timed
+from serialization import (
+    JSON_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    STREAM_MEDIA_TYPES,
+    build_response,
+    negotiate,
+    serialize_frame,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(f"Starting process pool with {HOLES_PROCESS_WORKERS} workers")
+    app.state.process_pool = ProcessPoolExecutor(max_workers=HOLES_PROCESS_WORKERS)
+    yield
+    app.state.process_pool.shutdown(cancel_futures=True)
+    await upstream_client.close()
+    await redis_async_client.aclose()
 
 tags_metadata = [
     {
@@ -19,7 +43,7 @@ tags_metadata = [
     },
 ]
 
-app = FastAPI(openapi_tags=tags_metadata)
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,24 +53,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def measure_request(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # у потоковых ответов измеряется время до заголовков, а не до конца потока
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_DURATION.labels(request.method, endpoint, status).observe(time.perf_counter() - started)
+
 @app.get("/")
 async def welcome():
     return {'status': 'ok'}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики в формате Prometheus, глубина очереди читается из Redis при запросе."""
+    if JOB_QUEUE_ENABLED:
+        try:
+            for state, depth in (await job_queue.get_depth()).items():
+                QUEUE_DEPTH.labels(state).set(depth)
+        except Exception as e:
+            logger.warning(f"Failed to read job queue depth: {e}")
+    content, media_type = await asyncio.to_thread(render_metrics)
+    return Response(content=content, media_type=media_type)
+
 @app.post("/upload_data", tags=['default'])
 async def upload_data(
     background_tasks: BackgroundTasks,
     rinexFile: UploadFile = File(...),
     manager: ParserManager = Depends(get_parser_manager)
 ):
-    await manager.set_parser(rinexFile)
-    parser = manager.get_parser()
-    
     task_id = str(uuid.uuid4())
+    parser = await manager.set_parser(task_id, rinexFile)
     
     logger.info(f'Create background task with id: {task_id}')
-    redis_client.set(task_id, json.dumps({'status': 'pending'}))
-    background_tasks.add_task(download_sattelite_files, parser, task_id)
+    await task_store.create(task_id)
+    if JOB_QUEUE_ENABLED:
+        await job_queue.enqueue(task_id)
+    else:
+        background_tasks.add_task(download_sattelite_files, parser, task_id)
     
     systems = parser.get_systems()
     graph_data = get_graph_data(systems, task_id)
@@ -59,106 +110,231 @@ async def upload_data(
     
 @app.post("/find_holes_in_data", tags=['default'])
 async def find_holes_in_data(
+    request: Request,
     task_id: str = Form(...),
     data_period: int = Form(15),
+    ordered: bool = Form(True),
     manager: ParserManager = Depends(get_parser_manager)
 ):
+    """Дыры в сигналах всех спутников задачи. С заголовком Accept: application/x-ndjson
+    ответ отдается потоком, по строке на спутник по мере расчета: в порядке файлов
+    при ordered, иначе в порядке готовности (исходная позиция в поле index).
+    Последняя строка - сводка summary."""
     logger.debug(f"Params in find_holes_in_data data_period = {data_period}, task_id = {task_id}")
-    task_info = json.loads(redis_client.get(task_id) or '{}')
+    task = await task_store.wait(task_id)
     
-    if not task_info:
+    if task is None:
         logger.error(f'Something went wrong with background task. Task id: {task_id}')
         raise HTTPException(status_code=404, detail="Files not found.")
     
-    while task_info['status'] == 'processing':
-        logger.info(f'User waiting for files. Task id: {task_id}')
-        await asyncio.sleep(1)
-        task_info = json.loads(redis_client.get(task_id) or '{}')
-    
-    if task_info['status'] == 'failed':
+    if task.status == TaskStatus.FAILED:
         logger.warning(f"Task processing failed. Task id: {task_id}")
         raise HTTPException(status_code=500, detail="Task processing failed.")
     
-    if task_info['status'] == 'completed':
-        logger.info(f"Task processing completed. Task id: {task_id}")
-        save_path = task_info['result']
+    if task.status != TaskStatus.COMPLETED:
+        logger.warning(f"Task is still processing after waiting. Task id: {task_id}")
+        raise HTTPException(status_code=504, detail="Task processing timed out.")
     
+    logger.info(f"Task processing completed. Task id: {task_id}")
+    files = task.files
     
-    parser = manager.get_parser()
-    
-    date = parser.get_date()
-    year = date.year
-    yday = str(date.timetuple().tm_yday).zfill(3)
-    
+    parser = await manager.get_parser(task_id)
     timestep = parser.get_timestep()
     
-    extract_to_folder =os.path.join(FILE_BASE_PATH, "satellite", f"{year}", yday)
-    result=[]
-    files = unzip_zip(save_path, extract_to_folder=extract_to_folder)
-    
     logger.debug(f"Creating a response with holes in {parser.filename}")
-    for file in files:
-        satellite = await SatelliteParser.create(file)
-        holes = find_holes(satellite, data_period, timestep)
-        
-        transformed_data=[]
-        for key, value in holes.items():
-            signal_holes_dict = {"x": key, "y": value}
-            transformed_data.append(signal_holes_dict)
-                    
-        data={}
-        data['id'] = satellite.get_satellite()
-        data['data'] = transformed_data
-        result.append(data)
+    loop = asyncio.get_running_loop()
+    if negotiate(request.headers.get("accept"), [JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE]) == NDJSON_MEDIA_TYPE:
+        lines = [
+            loop.run_in_executor(app.state.process_pool, find_satellite_holes_line, file, data_period, timestep, index)
+            for index, file in enumerate(files)
+        ]
+        return StreamingResponse(stream_holes(lines, files, ordered), media_type=NDJSON_MEDIA_TYPE)
+    
+    # ошибка одного файла, например удаленного из кэша, не должна ронять весь ответ
+    result = await asyncio.gather(*[
+        loop.run_in_executor(app.state.process_pool, find_satellite_holes, file, data_period, timestep)
+        for file in files
+    ], return_exceptions=True)
+    satellites = []
+    cached = 0
+    for file, item in zip(files, result):
+        if isinstance(item, BaseException):
+            satellites.append(get_holes_error(file, item))
+            continue
+        data, hit = item
+        satellites.append(data)
+        cached += hit
+    logger.debug(f"Hole events taken from cache for {cached} of {len(result)} satellites")
         
-    return JSONResponse(content=convert_numpy_to_list(result))
+    with timed('serialize_holes'):
+        response = JSONResponse(
+            content=convert_numpy_to_list(satellites),
+            headers={"X-Holes-Cache": get_holes_cache_status(cached, len(result))},
+        )
+    count_bytes('response', len(response.body))
+    return response
+
+
+def get_holes_cache_status(cached: int, total: int) -> str:
+    if total and cached == total:
+        return "hit"
+    return "partial" if cached else "miss"
+
+
+def get_holes_error(file: str, error: BaseException) -> dict:
+    logger.error(f"Failed to find holes in {file}: {error!r}")
+    return {'file': os.path.basename(file), 'error': 'Failed to find holes'}
+    
+    
+async def stream_holes(lines: list, files: list, ordered: bool):
+    """Строки NDJSON с дырами по мере расчета и итоговая строка summary."""
+    async def get_line(index: int) -> tuple[bytes, Optional[bool]]:
+        try:
+            return await lines[index]
+        except Exception as e:
+            error = {'index': index, **get_holes_error(files[index], e)}
+            return json.dumps(error).encode() + b"\n", None
+
+    started = time.perf_counter()
+    failed = 0
+    cached = 0
+    tasks = [asyncio.ensure_future(get_line(index)) for index in range(len(lines))]
+    try:
+        for task in (tasks if ordered else asyncio.as_completed(tasks)):
+            line, hit = await task
+            failed += hit is None
+            cached += bool(hit)
+            yield line
+        summary = {
+            'satellites': len(lines),
+            'failed': failed,
+            'cache': get_holes_cache_status(cached, len(lines)),
+            'ordered': ordered,
+            'elapsed': round(time.perf_counter() - started, 3),
+        }
+        yield json.dumps({'summary': summary}).encode() + b"\n"
+    finally:
+        # клиент отключился: расчеты, которые еще не начались, не нужны
+        for line in lines:
+            line.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+@app.get("/tasks/{task_id}/events", tags=['default'])
+async def task_progress(task_id: str):
+    """Поток Server-Sent Events с этапами обработки задачи до ее завершения."""
+    if await task_store.get(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found.")
+    
+    async def events():
+        async for task in task_store.listen(task_id):
+            if task is None:
+                # комментарий SSE не дает прокси закрыть простаивающее соединение
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {task.status.value}\ndata: {task.to_json()}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
     
     
 @app.post("/fetch_satellite_info", tags=['default'])
 async def get_satellite_data(
+    request: Request,
+    task_id: str = Form(...),
     satellite: str = Form(...),
+    precision: Optional[int] = Form(None, ge=0, le=15),
+    max_points: Optional[int] = Form(None, ge=2),
+    time_start: Optional[float] = Form(None),
+    time_end: Optional[float] = Form(None),
     manager: ParserManager = Depends(get_parser_manager)
 ):    
-    parser = manager.get_parser()
-    
-    date = parser.get_date()
-    year = date.year
-    yday = str(date.timetuple().tm_yday).zfill(3)
-    
-    radar = parser.get_radar_name().lower()
-    filename = f'{radar}_{satellite}_{yday}_{year%100}.dat'
-    filepath = os.path.join(FILE_BASE_PATH, "satellite", f"{year}", yday, filename)
-    logger.debug(f"Getting data for satellite: {satellite} from file: {filename}")
+    """Ряды спутника в формате по заголовку Accept: JSON (по умолчанию),
+    application/octet-stream (float32 с заголовком JSON), MessagePack или Arrow IPC.
+    precision округляет значения до заданного числа знаков после запятой,
+    time_start/time_end (в секундах от начала суток) ограничивают интервал, max_points прореживает
+    ряды по min/max в корзинах. Для спутника без данных ответ 204 без тела в любом
+    формате, для отсутствующего файла спутника - 404."""
+    parser = await manager.get_parser(task_id)
+    filepath = await asyncio.to_thread(get_satellite_filepath, parser, satellite)
+    logger.debug(f"Getting data for satellite: {satellite} from file: {filepath}")
 
-    _satellite = await SatelliteParser.create(filepath)
+    try:
+        result = await asyncio.to_thread(
+            load_satellite_series, filepath, parser.get_timestep(), max_points, time_start, time_end
+        )
+    except FileNotFoundError:
+        logger.warning(f"Satellite file not found: {filepath}")
+        raise HTTPException(status_code=404, detail="Satellite not found")
+    if result is None:
+        # тело было бы только в одном из форматов, поэтому ответ без тела
+        return Response(status_code=204)
     
-    signals = _satellite.get_signals()
-    data = _satellite.get_data()
+    return await asyncio.to_thread(
+        build_response,
+        result,
+        accept=request.headers.get("accept"),
+        accept_encoding=request.headers.get("accept-encoding"),
+        precision=precision,
+    )
+
+
+@app.post("/fetch_satellites_info", tags=['default'])
+async def get_satellites_data(
+    request: Request,
+    task_id: str = Form(...),
+    satellites: str = Form(...),
+    precision: Optional[int] = Form(None, ge=0, le=15),
+    max_points: Optional[int] = Form(None, ge=2),
+    time_start: Optional[float] = Form(None),
+    time_end: Optional[float] = Form(None),
+    manager: ParserManager = Depends(get_parser_manager)
+):
+    """Ряды нескольких спутников одним потоком. satellites - имена или шаблоны
+    через запятую (G01,G02 или G*). Спутники загружаются параллельно и отдаются
+    по мере готовности: NDJSON (по умолчанию) или кадры application/octet-stream
+    с префиксом длины. В каждом кадре есть поле satellite, у пустых и
+    отсутствующих спутников вместо рядов поле error."""
+    media_type = negotiate(request.headers.get("accept"), STREAM_MEDIA_TYPES)
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Supported formats: {', '.join(STREAM_MEDIA_TYPES)}")
+
+    parser = await manager.get_parser(task_id)
+    patterns = [pattern.strip() for pattern in satellites.split(",") if pattern.strip()]
+    filepaths = await asyncio.to_thread(find_satellite_filepaths, parser, patterns)
     timestep = parser.get_timestep()
-    
-    if data is None:
-        logger.debug("Sattelite file is empty")
-        return JSONResponse(content='Empty satellite')
-    
-    tsn = data[:, 0]
-    time = data[:, 1]
-    elevation = data[:, 2]
-    signals_data = data[:, 4:].T
-    
-    result={
-        'tsn': tsn,
-        'seconds': time,
-        'elevation': elevation,
-        'signals': signals,
-        'data': signals_data,
-        'timestep': timestep
-    }
-    
-    return JSONResponse(content=convert_numpy_to_list(result))
-    
-    
-    
+    logger.debug(f"Getting data for {len(filepaths)} satellites by patterns: {patterns}")
+
+    def load_frame(satellite: str, filepath: str) -> bytes:
+        try:
+            result = load_satellite_series(filepath, timestep, max_points, time_start, time_end)
+            payload = {'satellite': satellite, **result} if result else {'satellite': satellite, 'error': 'Empty satellite'}
+        except FileNotFoundError:
+            payload = {'satellite': satellite, 'error': 'Satellite not found'}
+        except Exception as e:
+            logger.error(f"Failed to load satellite {satellite}: {e}")
+            payload = {'satellite': satellite, 'error': 'Failed to load satellite'}
+        return serialize_frame(payload, media_type, precision)
+
+    async def stream():
+        frames = [
+            asyncio.create_task(asyncio.to_thread(load_frame, satellite, filepath))
+            for satellite, filepath in filepaths.items()
+        ]
+        try:
+            for frame in asyncio.as_completed(frames):
+                yield await frame
+        finally:
+            for frame in frames:
+                frame.cancel()
+
+    return StreamingResponse(stream(), media_type=media_type, headers={"Vary": "Accept"})
             
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting app")
@@ -0,0 +1,123 @@
+from config import logger
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+import asyncio
+import functools
+import os
+import time
+
+# уровень модуля задается через LOG_LEVELS
+logger = logger.get_child(__name__)
+
+# Этапы занимают от миллисекунд (разбор файла спутника) до минут (конвертация в сервисе)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_DURATION = Histogram(
+    'rinex_stage_duration_seconds', 'Duration of pipeline stages', ['stage'], buckets=STAGE_BUCKETS
+)
+REQUEST_DURATION = Histogram(
+    'rinex_http_request_duration_seconds', 'Time until response headers by endpoint',
+    ['method', 'endpoint', 'status'], buckets=REQUEST_BUCKETS,
+)
+QUEUE_DEPTH = Gauge(
+    'rinex_job_queue_depth', 'Jobs in the conversion queue by state', ['state'], multiprocess_mode='mostrecent'
+)
+TASKS_IN_FLIGHT = Gauge(
+    'rinex_tasks_in_flight', 'Conversion tasks being processed', multiprocess_mode='livesum'
+)
+CACHE_REQUESTS = Counter(
+    'rinex_cache_requests_total', 'Cache lookups by cache and result', ['cache', 'result']
+)
+PROCESSED_BYTES = Counter(
+    'rinex_processed_bytes_total', 'Bytes read or written by stage', ['stage']
+)
+
+
+class StageTimer:
+    """Замер длительности этапа в STAGE_DURATION.
+
+    Используется как контекстный менеджер (with timed('unzip'):) или как
+    декоратор обычных и async функций (@timed('unzip')). Замер стоит
+    несколько микросекунд, время пишется и при исключении.
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.histogram = _get_stage_histogram(stage)
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+    def __call__(self, function):
+        histogram = self.histogram
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+        return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def _get_stage_histogram(stage: str):
+    # поиск дочерней метрики по метке идет под блокировкой, этапов немного
+    return STAGE_DURATION.labels(stage)
+
+
+def timed(stage: str) -> StageTimer:
+    return StageTimer(stage)
+
+
+def count_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def count_bytes(stage: str, size: int):
+    PROCESSED_BYTES.labels(stage).inc(size)
+
+
+def get_registry() -> CollectorRegistry:
+    # процессы пула и воркеры пишут метрики в общую папку, если она задана
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int):
+    logger.info("Serving metrics on port %d", port)
+    start_http_server(port, registry=get_registry())
@@ -0,0 +1,125 @@
+from config import (
+    FILE_BASE_PATH,
+    NAV_CACHE_MAX_SIZE,
+    NAV_CACHE_LOCK_TIMEOUT,
+    NAV_FILES_URL,
+    logger,
+    redis_async_client,
+)
+from metrics import count_cache
+from upstream_client import upstream_client
+
+import asyncio
+import os
+import redis
+
+class NavCache:
+    """Общий кэш суточных навигационных файлов по (год, день года).
+
+    Файлы хранятся сжатыми в downloaded_files/<year>/<doy>. Одновременные
+    загрузки одного дня объединяются внутри процесса и через блокировку
+    в Redis между процессами, при превышении объема удаляются файлы,
+    к которым дольше всего не обращались.
+    """
+
+    def __init__(self, max_size: int = NAV_CACHE_MAX_SIZE, lock_timeout: int = NAV_CACHE_LOCK_TIMEOUT):
+        self.folder = os.path.join(FILE_BASE_PATH, 'downloaded_files')
+        self.max_size = max_size
+        self.lock_timeout = lock_timeout
+        self.downloads: dict[tuple[int, str], asyncio.Task] = {}
+
+    @staticmethod
+    def get_nav_filename(year: int, yday: str) -> str:
+        return f'BRDC00IGS_R_{year}{yday}0000_01D_MN.rnx.gz'
+
+    def get_path(self, year: int, yday: str) -> str:
+        return os.path.join(self.folder, f"{year}", yday, self.get_nav_filename(year, yday))
+
+    async def get(self, year: int, yday: str) -> str:
+        """Путь к сжатому навигационному файлу дня, загружает его при отсутствии."""
+        path = self.get_path(year, yday)
+        if self.__touch(path):
+            logger.info(f"Navigation file found in cache: {path}")
+            count_cache('nav', True)
+            return path
+        count_cache('nav', False)
+
+        key = (year, yday)
+        if key not in self.downloads:
+            self.downloads[key] = asyncio.create_task(self.__fetch(year, yday, path))
+            self.downloads[key].add_done_callback(lambda _: self.downloads.pop(key, None))
+        else:
+            logger.debug(f"Waiting for navigation file download already in progress: {path}")
+        # отмена одного ожидающего не должна прерывать загрузку для остальных
+        return await asyncio.shield(self.downloads[key])
+
+    async def __fetch(self, year: int, yday: str, path: str) -> str:
+        lock = redis_async_client.lock(f"nav_lock:{year}:{yday}", timeout=self.lock_timeout)
+        try:
+            acquired = await lock.acquire(blocking_timeout=self.lock_timeout)
+        except redis.RedisError as e:
+            logger.warning(f"Navigation file lock is unavailable, downloading without it: {e}")
+            acquired = False
+
+        try:
+            # файл мог загрузить другой процесс, пока ждали блокировку
+            if self.__touch(path):
+                logger.info(f"Navigation file downloaded by another worker: {path}")
+                return path
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            href = f"{NAV_FILES_URL}/{year}/{yday}/nav/{self.get_nav_filename(year, yday)}"
+            await upstream_client.download(href, path, stage='nav_download')
+            logger.info(f"Navigation file downloaded successfully to {path}")
+        finally:
+            if acquired:
+                await self.__release(lock)
+
+        await asyncio.to_thread(self.__evict, path)
+        return path
+
+    @staticmethod
+    def __touch(path: str) -> bool:
+        # время изменения используется как время последнего обращения для LRU
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    async def __release(lock):
+        try:
+            await lock.release()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to release navigation file lock: {e}")
+
+    def __evict(self, keep: str):
+        files = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                logger.debug(f"Navigation file evicted from cache: {path}")
+            except FileNotFoundError:
+                continue
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+nav_cache = NavCache()
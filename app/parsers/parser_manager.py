@@ -1,28 +1,103 @@
 from parsers.rinex_parser import RinexParser
 from fastapi import UploadFile, HTTPException
+from collections import OrderedDict
 from typing import Optional
 
-from config import logger
+from config import (
+    PARSER_REGISTRY_MAX_SIZE,
+    PARSER_REGISTRY_PERSIST,
+    PARSER_REGISTRY_TTL,
+    logger,
+    redis_async_client,
+)
+
+import json
+import time
+import redis
 
 class ParserManager:
-    def __init__(self):
+    """Реестр парсеров RINEX по task_id с вытеснением по LRU и TTL.
+
+    Метаданные парсера дополнительно сохраняются в Redis, чтобы задачу
+    могла обслужить другая реплика или перезапущенный процесс.
+    """
+    
+    def __init__(
+            self,
+            max_size: int = PARSER_REGISTRY_MAX_SIZE,
+            ttl: int = PARSER_REGISTRY_TTL,
+            persist: bool = PARSER_REGISTRY_PERSIST,
+        ):
         logger.debug("Initializing ParserManager")
-        self.parser: Optional[RinexParser] = None
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self.parsers: OrderedDict[str, tuple[float, RinexParser]] = OrderedDict()
 
-    async def set_parser(self, rinex_file: UploadFile):
-        logger.info(f"Setting parser for file: {rinex_file.filename}")
+    async def set_parser(self, task_id: str, rinex_file: UploadFile) -> RinexParser:
+        logger.info(f"Setting parser for file: {rinex_file.filename}, task id: {task_id}")
         try:
-            self.parser = await RinexParser.create(rinex_file)
+            parser = await RinexParser.create(rinex_file)
             logger.debug(f"Parser successfully created for file: {rinex_file.filename}")
         except Exception as e:
             logger.error(f"Error while creating parser for file {rinex_file.filename}: {e}")
             raise HTTPException(status_code=500, detail="Error initializing parser")
+        
+        self.__put(task_id, parser, time.monotonic() + self.ttl)
+        if self.persist:
+            await self.__save(task_id, parser)
+        return parser
 
-    def get_parser(self) -> RinexParser:
-        if self.parser is None:
-            logger.warning("Attempted to access parser before initialization")
-            raise HTTPException(status_code=400, detail="Parser not initialized")
-        return self.parser
+    async def get_parser(self, task_id: str) -> RinexParser:
+        self.__evict_expired()
+        
+        if task_id in self.parsers:
+            self.parsers.move_to_end(task_id)
+            return self.parsers[task_id][1]
+        
+        parser = await self.__restore(task_id) if self.persist else None
+        if parser is None:
+            logger.warning(f"Attempted to access parser for unknown task: {task_id}")
+            raise HTTPException(status_code=404, detail="Parser not found for task")
+        return parser
+    
+    def __put(self, task_id: str, parser: RinexParser, expires_at: float):
+        self.parsers[task_id] = (expires_at, parser)
+        self.parsers.move_to_end(task_id)
+        self.__evict_expired()
+        while len(self.parsers) > self.max_size:
+            evicted_id, _ = self.parsers.popitem(last=False)
+            logger.debug(f"Parser for task {evicted_id} evicted from registry")
+    
+    def __evict_expired(self):
+        now = time.monotonic()
+        expired = [task_id for task_id, (expires_at, _) in self.parsers.items() if expires_at <= now]
+        for task_id in expired:
+            del self.parsers[task_id]
+            logger.debug(f"Parser for task {task_id} expired")
+    
+    async def __save(self, task_id: str, parser: RinexParser):
+        try:
+            await redis_async_client.set(f"parser:{task_id}", json.dumps(parser.to_metadata()), ex=self.ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to persist parser for task {task_id}: {e}")
+    
+    async def __restore(self, task_id: str) -> Optional[RinexParser]:
+        try:
+            key = f"parser:{task_id}"
+            async with redis_async_client.pipeline(transaction=False) as pipe:
+                metadata, ttl = await pipe.get(key).ttl(key).execute()
+        except redis.RedisError as e:
+            logger.warning(f"Failed to restore parser for task {task_id}: {e}")
+            return None
+        
+        if metadata is None:
+            return None
+        
+        parser = RinexParser.from_metadata(json.loads(metadata))
+        self.__put(task_id, parser, time.monotonic() + max(ttl, 0))
+        logger.info(f"Parser for task {task_id} restored from Redis")
+        return parser
 
 async def get_parser_manager() -> ParserManager:
     return parser_manager
@@ -1,13 +1,30 @@
 from fastapi import UploadFile
 from datetime import date
 
-from config import FILE_BASE_PATH, logger
+from config import FILE_BASE_PATH, UPLOAD_CHUNK_SIZE, logger
+from metrics import count_bytes, timed
 
+from contextlib import contextmanager
+from importlib import resources
+
+import asyncio
+import gzip
+import hashlib
+import io
+import itertools
 import re
+import subprocess
+import uuid
 import zipfile
-import io
 import os
 
+ZIP_MAGIC = b"PK\x03\x04"
+GZIP_MAGIC = b"\x1f\x8b"
+COMPRESS_MAGIC = b"\x1f\x9d"
+HATANAKA_LABEL = "CRINEX VERS   / TYPE"
+HEADER_LABEL_START = 60
+HEADER_LABEL_END = 80
+
 class RinexParser:
     
     def __init__(self, file: UploadFile):
@@ -19,6 +36,9 @@ class RinexParser:
         self.radar_name = None
         self.date = None
         self.systems = {}
+        self.compression = None
+        self.hatanaka = False
+        self.content_hash = None
         
         logger.info(f"Initialized RinexParser for file: {self.filename}")
         
@@ -28,61 +48,107 @@ class RinexParser:
         logger.info(f"Creating instance for file: {file.filename}")
         await instance.process_file()
         return instance
+    
+    @classmethod
+    def from_metadata(cls, metadata: dict):
+        instance = cls.__new__(cls)
+        instance.save_path = f"{FILE_BASE_PATH}unzipped_files"
+        instance.file = metadata['file']
+        instance.filename = metadata['filename']
+        instance.timestep = metadata['timestep']
+        instance.radar_coords = tuple(metadata['radar_coords']) if metadata['radar_coords'] else None
+        instance.radar_name = metadata['radar_name']
+        instance.date = date.fromisoformat(metadata['date']) if metadata['date'] else None
+        instance.systems = metadata['systems']
+        instance.compression = metadata.get('compression')
+        instance.hatanaka = metadata.get('hatanaka', False)
+        instance.content_hash = metadata.get('content_hash')
+        logger.debug(f"Restored RinexParser for file: {instance.filename}")
+        return instance
+    
+    def to_metadata(self) -> dict:
+        return {
+            'file': self.file,
+            'filename': self.filename,
+            'timestep': self.timestep,
+            'radar_coords': self.radar_coords,
+            'radar_name': self.radar_name,
+            'date': self.date.isoformat() if self.date else None,
+            'systems': self.systems,
+            'compression': self.compression,
+            'hatanaka': self.hatanaka,
+            'content_hash': self.content_hash,
+        }
         
+    @timed('rinex_process')
     async def process_file(self):
-        try:
-            self.file = await self.__unzip(self.file)
-            logger.info(f"File unzipped: {self.file}")
-        except Exception as e:
-            logger.warning(f"File {self.filename} already unzipped or error during unzipping: {e}")
-            self.file = await self.__newFile(self.file)
+        with timed('rinex_store'):
+            self.file = await asyncio.to_thread(self.__store_upload, self.file.file)
+        count_bytes('rinex_upload', os.path.getsize(self.file))
         
-        logger.debug(f"Processing file: {self.file}")
-        with open (self.file, 'r') as f:
-            for line in f:
-                if line[0] == ">":
-                    break
+        self.compression = self.__detect_compression()
+        
+        logger.debug(f"Processing file: {self.file}, compression: {self.compression}")
+        with self.__open_stream() as stream:
+            lines = io.TextIOWrapper(stream, encoding='ascii', errors='replace')
+            first_line = lines.readline()
+            self.hatanaka = first_line[HEADER_LABEL_START:HEADER_LABEL_END].strip() == HATANAKA_LABEL
+            # заголовок Hatanaka содержит исходный заголовок RINEX без изменений
+            self.scan_header(itertools.chain([first_line], lines))
+    
+    def scan_header(self, lines):
+        """Разбор заголовка RINEX по меткам в колонках 61-80.
 
-                if self.timestep is None:
-                    timestep_match = re.search(r"(\d+\.\d+)\s+INTERVAL", line)
-                    if timestep_match:
-                        self.timestep = float(timestep_match.group(1).strip())
-                        logger.debug(f"Timestep found: {self.timestep} in file: {self.file}")
-                
-                if self.radar_coords is None:
-                    radar_coords_match = re.findall(r"(.*)\s+APPROX POSITION XYZ", line)
-                    if radar_coords_match:
-                        splited = radar_coords_match[0].split()
-                        self.radar_coords = (float(splited[0]), float(splited[1]), float(splited[2]))
-                        logger.debug(f"Radar coordinates found: {self.radar_coords} in file: {self.file}")
-                        
-                if self.radar_name is None:
-                    radar_name_match = re.search(r"(.*)\s+MARKER NAME", line)
-                    if radar_name_match:
-                        self.radar_name = radar_name_match.group(1).strip()
-                        logger.debug(f"Radar name found: {self.radar_name} in file: {self.file}")
-                
-                systems_match = re.findall(r"(.*)\s+SYS / # / OBS TYPES ", line)
-                if systems_match:
-                    splited = systems_match[0].split()
-                    system = f"{splited[0]}_signals".lower()
-                    system_types = splited[2:]
-                    self.systems[system] = system_types
-                    logger.debug(f"System found: {system} with types {system_types} in file: {self.file}")
-                    
-                if self.date is None:
-                    date_match = re.findall(r"(.*)\s+TIME OF FIRST OBS", line)
-                    if date_match:
-                        splited = date_match[0].split()
-                        year, month, day = int(splited[0]), int(splited[1]), int(splited[2])
-                        self.date = date(year, month, day)
-                        logger.debug(f"Date found: {self.date} in file: {self.file}")
-                    
-                
+        Чтение останавливается на END OF HEADER, тело файла не читается.
+        """
+        system = None
+        for line in lines:
+            if line.startswith(">"):
+                break
+            
+            label = line[HEADER_LABEL_START:HEADER_LABEL_END].strip()
+            content = line[:HEADER_LABEL_START]
+            
+            match label:
+                case "END OF HEADER":
+                    break
+                case "INTERVAL" if self.timestep is None:
+                    self.timestep = float(content.split()[0])
+                    logger.debug(f"Timestep found: {self.timestep} in file: {self.file}")
+                case "APPROX POSITION XYZ" if self.radar_coords is None:
+                    splited = content.split()
+                    self.radar_coords = (float(splited[0]), float(splited[1]), float(splited[2]))
+                    logger.debug(f"Radar coordinates found: {self.radar_coords} in file: {self.file}")
+                case "MARKER NAME" if self.radar_name is None:
+                    self.radar_name = content.strip()
+                    logger.debug(f"Radar name found: {self.radar_name} in file: {self.file}")
+                case "SYS / # / OBS TYPES":
+                    # строки продолжения начинаются с пробела вместо кода системы
+                    if content[0] != " ":
+                        system = f"{content[0]}_signals".lower()
+                        self.systems[system] = content[6:].split()
+                    elif system is not None:
+                        self.systems[system].extend(content[6:].split())
+                    logger.debug(f"System found: {system} with types {self.systems.get(system)} in file: {self.file}")
+                case "TIME OF FIRST OBS" if self.date is None:
+                    splited = content.split()
+                    year, month, day = int(splited[0]), int(splited[1]), int(splited[2])
+                    self.date = date(year, month, day)
+                    logger.debug(f"Date found: {self.date} in file: {self.file}")
                     
     def get_filepath(self):
         return self.file   
     
+    def get_rinex_filepath(self):
+        """Путь к несжатому файлу RINEX, распаковка выполняется при первом обращении."""
+        if self.compression is None and not self.hatanaka:
+            return self.file
+        
+        rinex_path = self.__uncompressed_path()
+        if not os.path.exists(rinex_path):
+            self.__decompress(rinex_path)
+        return rinex_path
+    
     def get_systems(self):
         return self.systems
     
@@ -100,43 +166,169 @@ class RinexParser:
     
     def get_filename(self):
         return self.filename
+    
+    def get_content_hash(self):
+        return self.content_hash
 
         
-    async def __newFile(self, file: UploadFile):
-        logger.debug(f"Saving new file: {file.filename}")
-        file.file.seek(0)
-        file_path = os.path.join(self.save_path, file.filename)
-        content = await file.read()
+    def __store_upload(self, upload):
+        upload.seek(0)
+        magic = upload.read(len(ZIP_MAGIC))
+        upload.seek(0)
         
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-        with open(file_path, "wb") as f:
-            f.write(content)
-            logger.info(f"File saved at: {file_path}")
+        if magic == ZIP_MAGIC:
+            file_path = self.__unzip(upload)
+            logger.info(f"File unzipped: {file_path}")
+        else:
+            file_path = self.__newFile(upload)
+        return file_path
+        
+    def __newFile(self, upload):
+        logger.debug(f"Saving new file: {self.filename}")
+        file_path = self.__store(upload, self.filename)
+        logger.info(f"File saved at: {file_path}")
             
         return file_path
     
-        
-    async def __unzip(self, file: UploadFile):
-        logger.debug(f"Attempting to unzip file: {file.filename}")
-        contents = await file.read()
+    def __store(self, source, filename):
+        # загрузка пишется во временный файл и переносится в папку своего хэша:
+        # загрузки с одним именем не перезаписывают друг друга, пока ждут конвертации
+        os.makedirs(self.save_path, exist_ok=True)
+        temp_path = os.path.join(self.save_path, f"{uuid.uuid4().hex}.tmp")
+        try:
+            self.__copy(source, temp_path)
+            file_path = os.path.join(self.save_path, self.content_hash, os.path.basename(filename))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return file_path
+    
+    def __copy(self, source, file_path):
+        # файл пишется частями, чтобы память не зависела от размера загрузки,
+        # хэш содержимого считается в том же проходе
+        content_hash = hashlib.sha256()
+        with open(file_path, "wb") as f:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                content_hash.update(chunk)
+                f.write(chunk)
+        self.content_hash = content_hash.hexdigest()
+    
+    def __unzip(self, upload):
+        logger.debug(f"Attempting to unzip file: {self.filename}")
 
         try:
-            with zipfile.ZipFile(io.BytesIO(contents)) as z:
+            # zipfile читает архив напрямую из временного файла загрузки
+            with zipfile.ZipFile(upload) as z:
                 file_names = z.namelist()
 
                 if len(file_names) == 0:
                     logger.error(f"Archive {self.filename} is empty")
                     raise ValueError("Empty archive")
                 elif len(file_names) > 1:
-                    logger.error(f"Multiple files in archive: {self.file}")
+                    logger.error(f"Multiple files in archive: {self.filename}")
                     raise ValueError("Multiple files")
                 else:
-                    file_path = z.extract(file_names[0], self.save_path)
+                    with z.open(file_names[0]) as source:
+                        file_path = self.__store(source, file_names[0])
                     logger.info(f"File extracted to: {file_path}")
 
             return file_path
         except zipfile.BadZipFile as e:
             logger.error(f"Failed to unzip the file: {self.filename}")
             raise ValueError("Invalid ZIP file")
-    
\ No newline at end of file
+    
+    def __detect_compression(self):
+        with open(self.file, 'rb') as f:
+            magic = f.read(len(GZIP_MAGIC))
+        
+        if magic == GZIP_MAGIC:
+            return 'gzip'
+        if magic == COMPRESS_MAGIC:
+            return 'compress'
+        return None
+    
+    @contextmanager
+    def __open_stream(self):
+        if self.compression == 'gzip':
+            with gzip.open(self.file, 'rb') as stream:
+                yield stream
+        elif self.compression == 'compress':
+            # gzip умеет распаковывать формат Unix compress (.Z)
+            process = subprocess.Popen(
+                ['gzip', '-dc', self.file],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                yield process.stdout
+            finally:
+                process.stdout.close()
+                process.terminate()
+                process.wait()
+        else:
+            with open(self.file, 'rb') as stream:
+                yield stream
+    
+    def __uncompressed_path(self):
+        name = re.sub(r"\.(gz|Z)$", "", os.path.basename(self.file))
+        if self.hatanaka:
+            name = re.sub(r"\.crx$", ".rnx", name, flags=re.IGNORECASE)
+            name = re.sub(r"(\.\d\d)d$", r"\1o", name, flags=re.IGNORECASE)
+        if name == os.path.basename(self.file):
+            name = f"{name}.rnx"
+        if self.content_hash is None:
+            # разборщик восстановлен из метаданных, записанных до подсчета хэша
+            with open(self.file, 'rb') as f:
+                self.content_hash = hashlib.file_digest(f, 'sha256').hexdigest()
+        # загрузки с одним именем и разным содержимым распаковываются в разные файлы
+        return os.path.join(self.save_path, self.content_hash, name)
+    
+    @timed('rinex_decompress')
+    def __decompress(self, rinex_path: str):
+        logger.info(f"Decompressing {self.file} to {rinex_path}")
+        os.makedirs(os.path.dirname(rinex_path), exist_ok=True)
+        # одно содержимое может распаковываться параллельно в потоках одного процесса
+        temp_path = f"{rinex_path}.{uuid.uuid4().hex}.tmp"
+        processes = []
+        
+        # распаковка цепочкой процессов: gzip -dc | crx2rnx -, без буферизации в памяти
+        with open(self.file, 'rb') as source, open(temp_path, 'wb') as target:
+            stdin = source
+            if self.compression is not None:
+                processes.append(subprocess.Popen(
+                    ['gzip', '-dc'],
+                    stdin=stdin,
+                    stdout=subprocess.PIPE if self.hatanaka else target,
+                    stderr=subprocess.PIPE,
+                ))
+                stdin = processes[-1].stdout
+            if self.hatanaka:
+                crx2rnx = resources.files('hatanaka.bin').joinpath('crx2rnx')
+                processes.append(subprocess.Popen(
+                    [str(crx2rnx), '-'],
+                    stdin=stdin,
+                    stdout=target,
+                    stderr=subprocess.PIPE,
+                ))
+                if self.compression is not None:
+                    stdin.close()
+            
+            errors = []
+            for process in reversed(processes):
+                stderr = process.stderr.read()
+                process.stderr.close()
+                process.wait()
+                # crx2rnx возвращает 2 при некритичных предупреждениях
+                if process.returncode not in (0, 2):
+                    errors.append(f"{process.args[0]}: {stderr.decode(errors='replace').strip()}")
+        
+        if errors:
+            os.remove(temp_path)
+            logger.error(f"Failed to decompress {self.file}: {errors}")
+            raise ValueError(f"Failed to decompress RINEX file: {errors}")
+        
+        os.replace(temp_path, rinex_path)
+        logger.info(f"File decompressed to: {rinex_path}")
@@ -1,54 +1,174 @@
 from pathlib import Path
 
 import numpy as np
-from config import logger
+from config import SATELLITE_CACHE_ENABLED, logger
+from metrics import count_cache, timed
+
+import json
+import mmap
+import os
+import re
+
+# уровень модуля задается через LOG_LEVELS
+logger = logger.get_child(__name__)
+
+HEADER_LINE_REGEX = re.compile(rb"^#.*$", re.MULTILINE)
 
 class SatelliteParser:
     
-    def __init__(self, file: Path, elevation: int|float = 10):
+    def __init__(self, file: Path, elevation: int|float = 10, dtype: np.dtype = np.float64):
         self.file = file
         self.filename = file.split('\\')[-1]
         self.elevation = elevation
+        self.dtype = dtype
         self.satellite = None
         self.headers = None
         self.site = None
         self.data = None
         self.zero_col_headers = None
-        logger.debug(f"Initializing SatelliteParser for file: {self.file}")
+        logger.debug("Initializing SatelliteParser for file: %s", self.file)
         
     @classmethod
-    async def create(cls, file: Path):
-        logger.info(f"Creating instance of SatelliteParser for file: {file}")
-        instance = cls(file)
+    async def create(cls, file: Path, dtype: np.dtype = np.float64):
+        logger.info("Creating instance of SatelliteParser for file: %s", file)
+        instance = cls(file, dtype=dtype)
         await instance.process_file()
         return instance
     
+    @classmethod
+    def load(cls, file: Path, dtype: np.dtype = np.float64):
+        logger.info("Loading instance of SatelliteParser for file: %s", file)
+        instance = cls(file, dtype=dtype)
+        instance.parse()
+        return instance
+    
     async def process_file(self):
-        logger.info(f"Processing file: {self.file}")
-        data = []
+        self.parse()
+    
+    @timed('satellite_parse')
+    def parse(self):
+        key = None
+        if SATELLITE_CACHE_ENABLED:
+            # ключ снимается до чтения: если файл изменится во время разбора,
+            # кэш сохранится с прежним ключом и не совпадет с новым файлом
+            key = self.__cache_key()
+            cached = self.__load_cache(key)
+            count_cache('satellite', cached)
+            if cached:
+                return
+        
+        logger.info("Processing file: %s", self.file)
         try:
-            with open(self.file, 'r') as f:
-                for line in f:
-                    if line[0] == '#':
-                        splited = line.split()[1:]
-                        
-                        match splited[0].lower():
-                            case 'site:':
-                                self.site = splited[1]
-                                logger.debug(f"Found site: {self.site} in file {self.file}")
-                            case 'satellite:':
-                                self.satellite = splited[1]
-                                logger.debug(f"Found satellite: {self.satellite} in file {self.file}")
-                            case 'columns:':
-                                self.headers = splited[1:]
-                                logger.debug(f"Headers: {self.headers} in file {self.file}")
-                    else:
-                        data.append(line.split())
-            self.data = np.array(data[1:]).astype(float)
+            with open(self.file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for match in HEADER_LINE_REGEX.finditer(mm):
+                    self.__parse_header_line(match.group().decode())
+                self.data = self.__read_data(f, mm)
             self.__clean_and_reorder_columns()
+        except FileNotFoundError:
+            # отсутствие файла вызывающие отличают от испорченного файла
+            raise
         except Exception as e:
-            logger.error(f"Error while processing file {self.file}: {e}")
+            logger.error("Error while processing file %s: %s", self.file, e)
+            return
+        
+        if key is not None:
+            self.__save_cache(key)
     
+    def __parse_header_line(self, line: str):
+        splited = line.split()[1:]
+        
+        match splited[0].lower():
+            case 'site:':
+                self.site = splited[1]
+                logger.debug("Found site: %s in file %s", self.site, self.file)
+            case 'satellite:':
+                self.satellite = splited[1]
+                logger.debug("Found satellite: %s in file %s", self.satellite, self.file)
+            case 'columns:':
+                self.headers = splited[1:]
+                logger.debug("Headers: %s in file %s", self.headers, self.file)
+    
+    def __read_data(self, f, mm: mmap.mmap):
+        # первая строка без '#' - строка заголовков, данные начинаются после нее
+        mm.seek(0)
+        line = mm.readline()
+        while line.startswith(b'#'):
+            line = mm.readline()
+        start = mm.tell()
+        
+        block = mm[start:]
+        first_row_end = block.find(b'\n')
+        columns = len(block[:first_row_end if first_row_end != -1 else len(block)].split())
+        rows = block.count(b'\n') + (0 if block.endswith(b'\n') else 1)
+        
+        if columns and b'#' not in block:
+            try:
+                values = np.fromstring(block, dtype=self.dtype, sep=' ')
+                if values.size == rows * columns:
+                    return values.reshape(rows, columns)
+            except ValueError:
+                pass
+        
+        logger.debug("Irregular data block, falling back to loadtxt in file %s", self.file)
+        f.seek(start)
+        return np.loadtxt(f, dtype=self.dtype, comments='#', ndmin=2)
+    
+    def __cache_paths(self):
+        return f"{self.file}.npy", f"{self.file}.json"
+    
+    def __cache_key(self):
+        stat = os.stat(self.file)
+        return {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'elevation': self.elevation,
+            'dtype': np.dtype(self.dtype).str,
+        }
+    
+    def __load_cache(self, key: dict) -> bool:
+        data_path, meta_path = self.__cache_paths()
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['key'] != key:
+                logger.debug("Binary cache is outdated for file %s", self.file)
+                return False
+            
+            self.site = meta['site']
+            self.satellite = meta['satellite']
+            self.headers = meta['headers']
+            self.zero_col_headers = meta['zero_col_headers']
+            self.data = np.load(data_path, mmap_mode='r') if meta['has_data'] else None
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("Binary cache is not available for file %s: %s", self.file, e)
+            return False
+        
+        logger.info("Loaded binary cache for file: %s", self.file)
+        return True
+    
+    def __save_cache(self, key: dict):
+        data_path, meta_path = self.__cache_paths()
+        meta = {
+            'key': key,
+            'site': self.site,
+            'satellite': self.satellite,
+            'headers': self.headers,
+            'zero_col_headers': self.zero_col_headers,
+            'has_data': self.data is not None,
+        }
+        try:
+            # запись во временные файлы и атомарная замена, чтобы параллельные
+            # читатели не увидели недописанный кэш
+            if self.data is not None:
+                with open(f"{data_path}.{os.getpid()}.tmp", 'wb') as f:
+                    np.save(f, np.ascontiguousarray(self.data))
+                os.replace(f"{data_path}.{os.getpid()}.tmp", data_path)
+            with open(f"{meta_path}.{os.getpid()}.tmp", 'w') as f:
+                json.dump(meta, f)
+            os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+            logger.debug("Saved binary cache for file %s", self.file)
+        except OSError as e:
+            logger.warning("Failed to save binary cache for file %s: %s", self.file, e)
     
     def get_data(self):
         return self.data
@@ -59,6 +179,9 @@ class SatelliteParser:
     def get_filename(self):
         return self.filename
     
+    def get_filepath(self):
+        return self.file
+    
     def get_headers(self):
         return self.headers
     
@@ -73,16 +196,12 @@ class SatelliteParser:
     def get_satellite(self):
         return self.satellite
     
-    def __hours_to_seconds(self, hour):
-        seconds = int(round(hour * 3600))
-        return seconds
-    
     def __clean_and_reorder_columns(self):
-        logger.debug(f"Cleaning and reordering columns based on elevation in file {self.file}")
+        logger.debug("Cleaning and reordering columns based on elevation in file %s", self.file)
         
         # замена значений на 0 для строк с elevation < 10 начиная с 4 элемента
         mask = self.data[:, 2] <= self.elevation
-        logger.info(f"Cleaning columns with elevation <= {self.elevation} in file {self.file}")
+        logger.info("Cleaning columns with elevation <= %s in file %s", self.elevation, self.file)
         self.data[mask, 4:] = 0
         
         # найти столбцы, где все значения = 0
@@ -90,7 +209,7 @@ class SatelliteParser:
         non_zero_cols = ~zero_cols
 
         self.zero_col_headers = [self.headers[i + 4] for i in np.where(zero_cols)[0]]
-        logger.debug(f"Columns headers without data: {self.zero_col_headers} in file {self.file}")
+        logger.debug("Columns headers without data: %s in file %s", self.zero_col_headers, self.file)
         
         # создать новый порядок столбцов, перемещая столбцы с нулями в конец
         new_order = np.concatenate((np.arange(4), np.where(non_zero_cols)[0] + 4, np.where(zero_cols)[0] + 4))
@@ -106,10 +225,10 @@ class SatelliteParser:
 
         self.data = self.data.T
         if len(self.data) > 4:
-            self.data[1] = np.vectorize(self.__hours_to_seconds)(self.data[1])
+            self.data[1] = np.rint(self.data[1] * 3600)
             self.data = self.data.T
-            logger.debug(f"Converted time to seconds and adjusted data structure in file {self.file}")
+            logger.debug("Converted time to seconds and adjusted data structure in file %s", self.file)
         else:
             self.data = None
-            logger.warning(f"No data available after cleaning in file {self.file}")
+            logger.warning("No data available after cleaning in file %s", self.file)
             
\ No newline at end of file
@@ -0,0 +1,190 @@
+from parsers.rinex_parser import RinexParser
+from config import (
+    FILE_BASE_PATH,
+    RESULT_CACHE_MAX_SIZE,
+    RESULT_MANIFEST_FILENAME,
+    UPLOAD_CHUNK_SIZE,
+    logger,
+    redis_client,
+)
+from metrics import count_cache
+
+from datetime import datetime, timezone
+from typing import Optional
+
+import glob
+import hashlib
+import json
+import os
+import redis
+import shutil
+import uuid
+
+class ResultCache:
+    """Кэш архивов сервиса конвертации по содержимому файла RINEX.
+
+    Ключ - хэш содержимого загруженного файла вместе с запрошенными
+    системами и шагом, поэтому разные станции одного дня не смешиваются.
+    Метаданные и счетчики попаданий хранятся в Redis, источником истины
+    остается файл на диске. Архив и папка с распакованными файлами спутников
+    учитываются в одном объеме, при его превышении оба удаляются для ключей,
+    к которым дольше всего не обращались.
+    """
+
+    def __init__(self, max_size: int = RESULT_CACHE_MAX_SIZE):
+        self.folder = f'{FILE_BASE_PATH}result_csv'
+        # распакованные результаты: satellite/<year>/<yday>/<key>
+        self.extract_folder = os.path.join(FILE_BASE_PATH, "satellite")
+        self.max_size = max_size
+
+    def get_key(self, parser: RinexParser, systems: dict) -> str:
+        content_hash = parser.get_content_hash()
+        if content_hash is None:
+            # парсер восстановлен из метаданных, сохраненных до появления хэша
+            content_hash = self.__hash_file(parser.get_filepath())
+            parser.content_hash = content_hash
+
+        key = hashlib.sha256(content_hash.encode())
+        key.update(json.dumps(systems, sort_keys=True).encode())
+        return key.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.zip")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.get_path(key)
+        try:
+            # время изменения используется как время последнего обращения для LRU
+            os.utime(path)
+        except FileNotFoundError:
+            logger.debug(f"Result cache miss for key {key}")
+            self.__count("result_cache:misses")
+            count_cache('result', False)
+            return None
+
+        logger.info(f"Result cache hit for key {key}: {path}")
+        self.__count("result_cache:hits")
+        count_cache('result', True)
+        try:
+            redis_client.hset(f"result:{key}", "last_access", self.__now())
+        except redis.RedisError as e:
+            logger.warning(f"Failed to update result metadata for key {key}: {e}")
+        return path
+
+    def put(self, key: str, parser: RinexParser, systems: dict):
+        path = self.get_path(key)
+        metadata = {
+            'path': path,
+            'size': os.path.getsize(path),
+            'filename': parser.get_filename(),
+            'station': parser.get_radar_name() or '',
+            'date': parser.get_date().isoformat(),
+            'systems': json.dumps(systems, sort_keys=True),
+            'created': self.__now(),
+            'last_access': self.__now(),
+        }
+        try:
+            redis_client.hset(f"result:{key}", mapping=metadata)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to store result metadata for key {key}: {e}")
+        logger.info(f"Result for key {key} cached at {path}")
+
+    def touch(self, folder: str):
+        # время изменения манифеста - время последнего обращения к распакованному результату
+        try:
+            os.utime(os.path.join(folder, RESULT_MANIFEST_FILENAME))
+        except FileNotFoundError:
+            pass
+
+    def get_stats(self) -> dict:
+        try:
+            hits, misses = redis_client.mget("result_cache:hits", "result_cache:misses")
+        except redis.RedisError as e:
+            logger.warning(f"Failed to read result cache counters: {e}")
+            hits = misses = None
+        return {'hits': int(hits or 0), 'misses': int(misses or 0)}
+
+    def evict(self, keep: str = None):
+        entries = {}
+        for key, mtime, size, path in [*self.__scan_archives(), *self.__scan_extracted()]:
+            entry = entries.setdefault(key, {'last_access': 0, 'size': 0, 'paths': []})
+            entry['last_access'] = max(entry['last_access'], mtime)
+            entry['size'] += size
+            entry['paths'].append(path)
+
+        total = sum(entry['size'] for entry in entries.values())
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            for path in entry['paths']:
+                self.__remove(path)
+            total -= entry['size']
+            try:
+                redis_client.delete(f"result:{key}")
+            except redis.RedisError as e:
+                logger.warning(f"Failed to remove result metadata for key {key}: {e}")
+            logger.debug(f"Result evicted from cache: {', '.join(entry['paths'])}")
+
+    def __scan_archives(self):
+        if not os.path.isdir(self.folder):
+            return
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or not entry.name.endswith(".zip"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield entry.name[:-len(".zip")], stat.st_mtime, stat.st_size, entry.path
+
+    def __scan_extracted(self):
+        # временные папки распаковки и удаления начинаются с точки
+        for folder in glob.glob(os.path.join(self.extract_folder, '*', '*', '*')):
+            size = 0
+            for root, _, names in os.walk(folder):
+                for name in names:
+                    try:
+                        size += os.path.getsize(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+            try:
+                mtime = os.path.getmtime(os.path.join(folder, RESULT_MANIFEST_FILENAME))
+            except FileNotFoundError:
+                continue
+            yield os.path.basename(folder), mtime, size, folder
+
+    @staticmethod
+    def __remove(path: str):
+        try:
+            if not os.path.isdir(path):
+                os.remove(path)
+                return
+            # папка сначала исчезает целиком, читатели не видят ее частично удаленной
+            tmp_path = os.path.join(os.path.dirname(path), f".evict-{uuid.uuid4().hex}")
+            os.rename(path, tmp_path)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @staticmethod
+    def __count(counter: str):
+        try:
+            redis_client.incr(counter)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to update {counter}: {e}")
+
+    @staticmethod
+    def __now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    @staticmethod
+    def __hash_file(path: str) -> str:
+        content_hash = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+result_cache = ResultCache()
@@ -0,0 +1,213 @@
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from config import COMPRESSION_MIN_SIZE, logger
+from metrics import count_bytes, timed
+
+from typing import Optional
+
+import gzip
+import io
+import json
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MEDIA_TYPE = "application/json"
+RAW_MEDIA_TYPE = "application/octet-stream"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Форматы потока из нескольких рядов: строки NDJSON или кадры raw,
+# перед каждым кадром его длина (uint32 LE)
+STREAM_MEDIA_TYPES = [NDJSON_MEDIA_TYPE, RAW_MEDIA_TYPE]
+
+# Формат raw: длина заголовка (uint32 LE), заголовок JSON с описанием массивов,
+# выравнивание до 8 байт, затем массивы float32 LE подряд
+RAW_DTYPE = np.dtype('<f4')
+RAW_ALIGNMENT = 8
+
+
+def get_media_types() -> list:
+    """Поддерживаемые форматы в порядке предпочтения при равном q."""
+    media_types = [JSON_MEDIA_TYPE, RAW_MEDIA_TYPE]
+    if msgpack is not None:
+        media_types.append(MSGPACK_MEDIA_TYPE)
+    if pyarrow is not None:
+        media_types.append(ARROW_MEDIA_TYPE)
+    return media_types
+
+
+def negotiate(accept: Optional[str], available: list) -> Optional[str]:
+    """Выбор варианта по заголовку Accept/Accept-Encoding с учетом q, None - ничего не подходит."""
+    if not accept:
+        return available[0]
+
+    ranges = []
+    for part in accept.split(","):
+        value, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, q = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(q)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((value.lower(), quality))
+
+    best, best_quality = None, 0.0
+    for candidate in available:
+        quality = _get_quality(candidate, ranges)
+        if quality > best_quality:
+            best, best_quality = candidate, quality
+    return best
+
+
+@timed('serialize')
+def serialize(payload: dict, media_type: str, precision: Optional[int] = None) -> bytes:
+    """Сериализует словарь, в котором массивы numpy передаются как данные, остальное - как метаданные."""
+    if precision is not None:
+        payload = {
+            key: np.round(value, precision) if isinstance(value, np.ndarray) else value
+            for key, value in payload.items()
+        }
+
+    if media_type == JSON_MEDIA_TYPE:
+        # те же параметры, что у JSONResponse
+        return json.dumps(_to_lists(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    if media_type == RAW_MEDIA_TYPE:
+        return _serialize_raw(payload)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(_to_lists(payload), use_single_float=True)
+    if media_type == ARROW_MEDIA_TYPE:
+        return _serialize_arrow(payload)
+    raise ValueError(f"Unsupported media type: {media_type}")
+
+
+def serialize_frame(payload: dict, media_type: str, precision: Optional[int] = None) -> bytes:
+    """Один кадр потока: строка NDJSON или raw с префиксом длины."""
+    if media_type == NDJSON_MEDIA_TYPE:
+        return serialize(payload, JSON_MEDIA_TYPE, precision) + b"\n"
+    if media_type == RAW_MEDIA_TYPE:
+        frame = serialize(payload, RAW_MEDIA_TYPE, precision)
+        return np.uint32(len(frame)).astype('<u4').tobytes() + frame
+    raise ValueError(f"Unsupported stream media type: {media_type}")
+
+
+@timed('compress')
+def compress(body: bytes, accept_encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    if len(body) < COMPRESSION_MIN_SIZE or not accept_encoding:
+        return body, None
+
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = negotiate(accept_encoding, encodings + ["identity"])
+    if encoding == "br":
+        return brotli.compress(body, quality=4), encoding
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=5), encoding
+    return body, None
+
+
+def build_response(
+    payload: dict,
+    accept: Optional[str] = None,
+    accept_encoding: Optional[str] = None,
+    precision: Optional[int] = None,
+) -> Response:
+    media_type = negotiate(accept, get_media_types())
+    if media_type is None:
+        logger.warning(f"No acceptable response format for Accept: {accept}")
+        raise HTTPException(status_code=406, detail=f"Supported formats: {', '.join(get_media_types())}")
+
+    body = serialize(payload, media_type, precision)
+    body, encoding = compress(body, accept_encoding)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    logger.debug(f"Response serialized as {media_type}, encoding: {encoding}, size: {len(body)}")
+    count_bytes('response', len(body))
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _get_quality(candidate: str, ranges: list) -> float:
+    # q берется у самого точного совпадения: type/subtype, затем type/*, затем */*
+    matched = None
+    for value, quality in ranges:
+        if value == candidate:
+            specificity = 3
+        elif value.endswith("/*") and candidate.startswith(value[:-1]):
+            specificity = 2
+        elif value in ("*/*", "*"):
+            specificity = 1
+        else:
+            continue
+        if matched is None or specificity > matched[0]:
+            matched = (specificity, quality)
+    return matched[1] if matched else 0.0
+
+
+def _to_lists(payload: dict) -> dict:
+    return {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in payload.items()}
+
+
+def _serialize_raw(payload: dict) -> bytes:
+    arrays = {key: value for key, value in payload.items() if isinstance(value, np.ndarray)}
+    header = {key: value for key, value in payload.items() if key not in arrays}
+    header['arrays'] = []
+
+    offset = 0
+    for key, value in arrays.items():
+        size = value.size * RAW_DTYPE.itemsize
+        header['arrays'].append({
+            'name': key,
+            'dtype': RAW_DTYPE.str,
+            'shape': list(value.shape),
+            'offset': offset,
+            'length': size,
+        })
+        offset += size
+
+    header_bytes = json.dumps(header).encode()
+    padding = -(4 + len(header_bytes)) % RAW_ALIGNMENT
+    buffer = io.BytesIO()
+    buffer.write(np.uint32(len(header_bytes) + padding).astype('<u4').tobytes())
+    buffer.write(header_bytes + b" " * padding)
+    for value in arrays.values():
+        buffer.write(np.ascontiguousarray(value, dtype=RAW_DTYPE).tobytes())
+    return buffer.getvalue()
+
+
+def _serialize_arrow(payload: dict) -> bytes:
+    # двумерные массивы раскладываются по строкам в колонки <ключ>.<номер строки>
+    columns = {}
+    metadata = {}
+    for key, value in payload.items():
+        if not isinstance(value, np.ndarray):
+            metadata[key] = json.dumps(value)
+        elif value.ndim == 1:
+            columns[key] = pyarrow.array(value.astype(np.float32))
+        else:
+            for row, values in enumerate(value):
+                columns[f"{key}.{row}"] = pyarrow.array(values.astype(np.float32))
+
+    table = pyarrow.table(columns).replace_schema_metadata(metadata)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,172 @@
+from config import TASK_EVENTS_HEARTBEAT, TASK_TTL, TASK_WAIT_TIMEOUT, logger, redis_async_client
+
+from contextlib import aclosing
+from dataclasses import dataclass, field, asdict
+from enum import Enum
+from typing import AsyncIterator, Optional
+
+import asyncio
+import json
+import time
+
+class TaskStatus(str, Enum):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+TERMINAL_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+# Из каких состояний допустим переход в данное, None - задачи еще нет
+TRANSITIONS = {
+    TaskStatus.PENDING: (None,),
+    TaskStatus.PROCESSING: (TaskStatus.PENDING, TaskStatus.PROCESSING),
+    TaskStatus.COMPLETED: (TaskStatus.PENDING, TaskStatus.PROCESSING),
+    TaskStatus.FAILED: (TaskStatus.PENDING, TaskStatus.PROCESSING),
+}
+
+# Проверка текущего состояния, запись и публикация выполняются в Redis атомарно
+TRANSITION_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local status = ''
+if current then
+    status = cjson.decode(current)['status']
+end
+for i = 3, #ARGV do
+    if ARGV[i] == status then
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+        redis.call('PUBLISH', KEYS[2], ARGV[1])
+        return 1
+    end
+end
+return 0
+"""
+
+
+@dataclass
+class TaskRecord:
+    task_id: str
+    status: TaskStatus
+    stage: Optional[str] = None
+    result: Optional[str] = None
+    files: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+    updated_at: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        return json.dumps({**asdict(self), 'status': self.status.value})
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> 'TaskRecord':
+        fields = json.loads(data)
+        fields['status'] = TaskStatus(fields['status'])
+        return cls(**fields)
+
+
+class TaskStore:
+    """Состояния фоновых задач в Redis с истечением по TTL.
+
+    Переходы между состояниями проверяются и публикуются в канал задачи
+    одним скриптом Lua, поэтому подписчики видят каждое изменение ровно
+    в том порядке, в котором оно было записано.
+    """
+
+    def __init__(self, ttl: int = TASK_TTL):
+        self.ttl = ttl
+        self.__transition = None
+
+    @staticmethod
+    def get_key(task_id: str) -> str:
+        return f"task:{task_id}"
+
+    @staticmethod
+    def get_channel(task_id: str) -> str:
+        return f"task_events:{task_id}"
+
+    async def create(self, task_id: str) -> TaskRecord:
+        record = TaskRecord(task_id, TaskStatus.PENDING)
+        if not await self.__save(record):
+            raise ValueError(f"Task {task_id} already exists")
+        return record
+
+    async def update(self, task_id: str, status: TaskStatus, **fields) -> bool:
+        record = TaskRecord(task_id, status, **fields)
+        if not await self.__save(record):
+            logger.warning(f"Rejected transition of task {task_id} to {status.value}")
+            return False
+        return True
+
+    async def get(self, task_id: str) -> Optional[TaskRecord]:
+        data = await redis_async_client.get(self.get_key(task_id))
+        return TaskRecord.from_json(data) if data else None
+
+    async def listen(
+        self,
+        task_id: str,
+        heartbeat: Optional[float] = TASK_EVENTS_HEARTBEAT,
+    ) -> AsyncIterator[Optional[TaskRecord]]:
+        """Состояния задачи до завершения: текущее, затем каждое опубликованное.
+
+        Если за heartbeat секунд ничего не пришло, возвращается None,
+        чтобы вызывающий мог поддержать соединение с клиентом.
+        """
+        async with redis_async_client.pubsub() as pubsub:
+            # подписка до чтения текущего состояния, чтобы не пропустить переход между ними
+            await pubsub.subscribe(self.get_channel(task_id))
+            record = await self.get(task_id)
+            yield record
+            if record is None or record.status in TERMINAL_STATUSES:
+                return
+
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+                if message is None:
+                    yield None
+                    continue
+                record = TaskRecord.from_json(message['data'])
+                yield record
+                if record.status in TERMINAL_STATUSES:
+                    return
+
+    async def wait(self, task_id: str, timeout: float = TASK_WAIT_TIMEOUT) -> Optional[TaskRecord]:
+        """Ожидает завершения задачи и возвращает ее итоговое состояние.
+
+        None - задачи нет. Если запись истекла во время ожидания, возвращается
+        FAILED, если задача не завершилась за timeout секунд - последнее состояние.
+        """
+        record = None
+        try:
+            async with asyncio.timeout(timeout):
+                # listen завершается сам после итогового состояния, aclosing закрывает подписку при выходе раньше
+                async with aclosing(self.listen(task_id)) as updates:
+                    async for update in updates:
+                        if update is None and record is None:
+                            return None
+                        if update is None:
+                            # запись, истекшая по TTL, не публикует итоговое состояние
+                            update = await self.get(task_id)
+                            if update is None:
+                                logger.warning(f"Task {task_id} state expired while waiting")
+                                return TaskRecord(task_id, TaskStatus.FAILED, error="Task state expired")
+                        record = update
+                        if record.status not in TERMINAL_STATUSES:
+                            logger.info(f"User waiting for files. Task id: {task_id}, stage: {record.stage}")
+        except TimeoutError:
+            logger.warning(f"Task {task_id} did not finish in {timeout} s")
+        return record
+
+    async def __save(self, record: TaskRecord) -> bool:
+        if self.__transition is None:
+            self.__transition = redis_async_client.register_script(TRANSITION_SCRIPT)
+
+        data = record.to_json()
+        allowed = [status.value if status else '' for status in TRANSITIONS[record.status]]
+        saved = await self.__transition(
+            keys=[self.get_key(record.task_id), self.get_channel(record.task_id)],
+            args=[data, self.ttl, *allowed],
+        )
+        if saved:
+            logger.debug(f"Task {record.task_id} state published: {data}")
+        return bool(saved)
+
+task_store = TaskStore()
@@ -0,0 +1,4 @@
+import os
+
+# config пишет лог в tmp/ относительно рабочей директории
+os.makedirs('tmp', exist_ok=True)
@@ -0,0 +1,75 @@
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from parsers.parser_manager import get_parser_manager
+from serialization import ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, RAW_MEDIA_TYPE
+from task_store import TaskRecord, TaskStatus
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'holes'
+
+
+class Parser:
+    # из разобранного RINEX эндпоинтам нужны только имя и шаг
+    filename = 'test0020.24o'
+
+    def get_timestep(self):
+        return 120
+
+
+class Manager:
+    async def get_parser(self, task_id: str):
+        return Parser()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # у задачи два файла спутников, второго на диске нет, как после вытеснения из кэша
+    files = [str(shutil.copy(FIXTURES / 'test_G01.dat', tmp_path)), str(tmp_path / 'test_G99.dat')]
+    # у E30 нет наблюдений выше угла отсечки
+    shutil.copy(FIXTURES / 'test_E30.dat', tmp_path)
+
+    async def wait(task_id: str):
+        return TaskRecord(task_id, TaskStatus.COMPLETED, files=files)
+
+    monkeypatch.setattr(main.task_store, 'wait', wait)
+    monkeypatch.setattr(main, 'get_satellite_filepath', lambda parser, satellite: str(tmp_path / f'test_{satellite}.dat'))
+    main.app.dependency_overrides[get_parser_manager] = Manager
+    main.app.state.process_pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        yield TestClient(main.app)
+    finally:
+        main.app.state.process_pool.shutdown()
+        main.app.dependency_overrides.clear()
+
+
+def test_fetch_satellite_info_missing_file(client):
+    response = client.post('/fetch_satellite_info', data={'task_id': 'task', 'satellite': 'G99'})
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'Satellite not found'}
+
+    response = client.post('/fetch_satellite_info', data={'task_id': 'task', 'satellite': 'G01'})
+    assert response.status_code == 200
+    assert response.json()['signals']
+
+
+@pytest.mark.parametrize('accept', [JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, RAW_MEDIA_TYPE, ARROW_MEDIA_TYPE])
+def test_fetch_satellite_info_empty_satellite(client, accept):
+    response = client.post(
+        '/fetch_satellite_info', data={'task_id': 'task', 'satellite': 'E30'}, headers={'Accept': accept}
+    )
+    assert response.status_code == 204
+    assert response.content == b''
+
+
+def test_find_holes_in_data_reports_missing_file(client):
+    response = client.post('/find_holes_in_data', data={'task_id': 'task', 'data_period': 15})
+    assert response.status_code == 200
+
+    satellites = response.json()
+    assert [satellite.get('id') for satellite in satellites] == ['G01', None]
+    assert satellites[1] == {'file': 'test_G99.dat', 'error': 'Failed to find holes'}
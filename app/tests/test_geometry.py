@@ -0,0 +1,75 @@
+import json
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from geometry import BroadcastGeometry, GeometryProvider, read_navigation
+
+# Навигационный файл с GPS, Galileo (e = 0.16), QZSS, BeiDou GEO, IGSO и MEO и двумя
+# спутниками ГЛОНАСС на 0-6 ч 2024-01-01. Эталон посчитан независимо: скалярной
+# реализацией формул ИКД, интегрированием ГЛОНАСС методом DOP853 и pymap3d для
+# ENU и углов. Эпохи выбраны вдали от смены эфемерид.
+FIXTURES = Path(__file__).parent / 'fixtures' / 'geometry'
+REFERENCE = json.loads((FIXTURES / 'reference.json').read_text())
+SATELLITES = REFERENCE['satellites']
+SECONDS = np.array(REFERENCE['seconds'])
+
+# Допуски: кеплеровы орбиты считаются по тем же формулам, ГЛОНАСС - шагом
+# Рунге-Кутты 60 с, углы - интерполяцией по узлам в float32
+POSITION_TOLERANCE = {'R': 5e-3}
+KEPLER_POSITION_TOLERANCE = 1e-3
+ENU_TOLERANCE = 1e-2
+ANGLE_TOLERANCE = 1e-4
+
+
+@pytest.fixture(scope='module')
+def geometry():
+    return BroadcastGeometry(str(FIXTURES / 'nav.rnx'), REFERENCE['position'], date.fromisoformat(REFERENCE['day']))
+
+
+def test_read_navigation():
+    ephemerides, leap_seconds = read_navigation(str(FIXTURES / 'nav.rnx'))
+    assert leap_seconds == 18
+    assert sorted(ephemerides) == sorted(SATELLITES)
+
+
+@pytest.mark.parametrize('index', range(len(SATELLITES)), ids=SATELLITES)
+def test_positions_match_reference(geometry, index):
+    satellite = SATELLITES[index]
+    positions = geometry.get_positions([satellite], SECONDS)[0]
+    tolerance = POSITION_TOLERANCE.get(satellite[0], KEPLER_POSITION_TOLERANCE)
+    np.testing.assert_allclose(positions, REFERENCE['ecef'][index], rtol=0, atol=tolerance)
+
+
+def test_enu_matches_reference(geometry):
+    positions = geometry.get_positions(SATELLITES, SECONDS)
+    local = (positions - geometry.position) @ geometry.rotation.T
+    np.testing.assert_allclose(local, REFERENCE['enu'], rtol=0, atol=ENU_TOLERANCE)
+
+
+def test_angles_match_reference(geometry):
+    elevations, azimuths = geometry.get_geometry(SATELLITES, SECONDS)
+    np.testing.assert_allclose(elevations, REFERENCE['elevation'], rtol=0, atol=ANGLE_TOLERANCE)
+    difference = (azimuths - np.array(REFERENCE['azimuth']) + 180) % 360 - 180
+    np.testing.assert_allclose(difference, 0, rtol=0, atol=ANGLE_TOLERANCE)
+
+
+def test_angles_do_not_depend_on_epoch_order(geometry):
+    order = np.random.default_rng(0).permutation(len(SECONDS))
+    elevations, azimuths = geometry.get_geometry(SATELLITES, SECONDS[order])
+    np.testing.assert_allclose(elevations, np.array(REFERENCE['elevation'])[:, order], rtol=0, atol=ANGLE_TOLERANCE)
+
+
+def test_unknown_or_outdated_positions_are_nan(geometry):
+    # эфемериды покрывают 0-6 ч, кеплеровы действуют 4 ч, ГЛОНАСС - 1 ч
+    elevations, azimuths = geometry.get_geometry(['G05', 'R01', 'G99'], np.array([0.0, 9 * 3600.0, 11 * 3600.0]))
+    assert not np.isnan(elevations[:2, 0]).any()
+    assert not np.isnan(elevations[0, 1]) and np.isnan(elevations[1, 1])
+    assert np.isnan(elevations[:, 2]).all() and np.isnan(azimuths[2]).all()
+
+
+def test_geometry_provider_is_abstract():
+    with pytest.raises(TypeError):
+        GeometryProvider()
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from config import ELEVATION
+from functions import find_holes
+from holes import aggregate_holes, find_hole_events
+from holes_cache import holes_cache
+from parsers.satellite_parser import SatelliteParser
+
+# Файлы спутников и дыры, которые вернула построчная реализация find_holes
+# до перехода на векторный подсчет (базовый коммит репозитория)
+FIXTURES = Path(__file__).parent / 'fixtures' / 'holes'
+CASES = json.loads((FIXTURES / 'expected.json').read_text())['cases']
+
+
+@pytest.fixture(params=CASES, ids=lambda case: f"{case['file']}-{case['data_period']}")
+def case(request, tmp_path):
+    # кэши разбора и дыр пишутся рядом с файлом, поэтому файл копируется
+    path = shutil.copy(FIXTURES / request.param['file'], tmp_path)
+    return request.param, SatelliteParser.load(str(path))
+
+
+def assert_identical(holes: dict, expected: dict):
+    assert list(holes) == list(expected)
+    for signal, values in expected.items():
+        assert holes[signal].dtype == np.int64, signal
+        assert holes[signal].tolist() == values, signal
+
+
+def test_find_holes_matches_legacy(case):
+    expected, satellite = case
+    holes, cached = find_holes(satellite, expected['data_period'], expected['timestep'])
+    assert not cached
+    assert_identical(holes, expected['holes'])
+
+    # второй запрос берет вклады строк из кэша и не должен менять результат
+    holes, cached = find_holes(satellite, expected['data_period'], expected['timestep'])
+    assert cached == (satellite.get_data() is not None)
+    assert_identical(holes, expected['holes'])
+
+
+def test_aggregate_holes_matches_legacy(case):
+    expected, satellite = case
+    data = satellite.get_data()
+    if data is None:
+        pytest.skip("no data after cleaning, find_holes does not reach the engine")
+
+    signals = satellite.get_headers()[4:data.shape[1]]
+    period_records = int((expected['data_period'] * 60) / expected['timestep'])
+    holes = aggregate_holes(find_hole_events(data, ELEVATION), signals, period_records)
+
+    # find_holes дополняет периоды до конца суток значением -1
+    for signal in signals:
+        values = expected['holes'][signal]
+        assert holes[signal].dtype == np.int64
+        assert holes[signal].tolist() == values[:len(holes[signal])], signal
+        assert set(values[len(holes[signal]):]) <= {-1}, signal
+
+
+def test_missing_satellite_file_is_reported(tmp_path):
+    # отсутствующий файл не должен превращаться в пустой спутник
+    with pytest.raises(FileNotFoundError):
+        SatelliteParser.load(str(tmp_path / 'absent_G01_002_24.dat'))
+
+
+def test_holes_cache_is_keyed_by_path(tmp_path):
+    # get_filename отрезает путь по '\\', у файлов двух задач он одинаковый
+    paths = [
+        str(shutil.copy(FIXTURES / 'test_G01.dat', tmp_path / 'task-1\\test_G01.dat')),
+        str(shutil.copy(FIXTURES / 'test_G07.dat', tmp_path / 'task-2\\test_G01.dat')),
+    ]
+    for path in paths:
+        satellite = SatelliteParser.load(path)
+        events, cached = holes_cache.get_events(satellite)
+        assert not cached
+        assert os.path.exists(holes_cache.get_path(path))
+        expected = find_hole_events(satellite.get_data(), ELEVATION)
+        assert list(events) == list(expected)
+        for name, values in expected.items():
+            assert np.array_equal(events[name], values), name
@@ -0,0 +1,117 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from geometry import GeometryProvider
+from local_conversion import LocalConverter, _format_fixed
+from parsers.rinex_parser import RinexParser
+from parsers.satellite_parser import SatelliteParser
+
+# Три эпохи наблюдений GPS и ГЛОНАСС по 30 с и эпоха события с флагом 4 между ними.
+# В наблюдениях есть отрицательные значения, пустые поля, флаги LLI и силы сигнала
+# и строки, обрезанные после первого наблюдения. G03 впервые появляется во второй эпохе.
+FIXTURES = Path(__file__).parent / 'fixtures' / 'local_conversion'
+
+
+class Geometry(GeometryProvider):
+    # угол места растет на градус в минуту и у каждого спутника свой, азимут по номеру
+    def get_geometry(self, satellites: list, seconds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        numbers = np.array([int(satellite[1:]) for satellite in satellites], dtype=float)
+        elevations = 20 + numbers[:, None] + seconds[None, :] / 60
+        azimuths = np.repeat(numbers[:, None] * 10, len(seconds), axis=1)
+        return elevations, azimuths
+
+
+@pytest.fixture
+def parser() -> RinexParser:
+    path = str(FIXTURES / 'obs.rnx')
+    parser = RinexParser.from_metadata({
+        'file': path,
+        'filename': 'obs.rnx',
+        'timestep': None,
+        'radar_coords': None,
+        'radar_name': None,
+        'date': None,
+        'systems': {},
+    })
+    with open(path) as f:
+        parser.scan_header(f)
+    return parser
+
+
+def convert(parser: RinexParser, folder: Path, block_size: int) -> dict:
+    folder.mkdir()
+    paths = LocalConverter(parser, Geometry(), block_size=block_size).convert(str(folder))
+    return {os.path.basename(path).split('_')[1]: path for path in paths}
+
+
+def load(path: str) -> dict:
+    satellite = SatelliteParser.load(path)
+    data = satellite.get_data()
+    return {name: data[:, index] for index, name in enumerate(satellite.get_headers()[:data.shape[1]])}
+
+
+@pytest.fixture(params=[1024 * 1024, 64, 150], ids=['single-block', 'epoch-per-block', 'split-epochs'])
+def files(request, parser, tmp_path) -> dict:
+    return convert(parser, tmp_path / 'satellites', request.param)
+
+
+def test_satellite_files(files):
+    # строка события после эпохи с флагом 4 не становится спутником G09
+    assert sorted(files) == ['G01', 'G03', 'R05']
+    assert os.path.basename(files['G01']) == 'test_G01_001_24.dat'
+
+
+def test_observations(files):
+    g01 = load(files['G01'])
+    assert g01['tsn'].tolist() == [0, 1, 2]
+    assert g01['hour'].tolist() == [0, 30, 60]
+    assert g01['el'] == pytest.approx([21, 21.5, 22])
+    assert g01['az'].tolist() == [10, 10, 10]
+    assert g01['C1C'].tolist() == [20000000.125, 20000100.0, 20000200.0]
+    # пустое поле - ноль, флаги LLI и силы сигнала в значение не попадают
+    assert g01['L1C'].tolist() == [105000000.25, 0, 105000100.5]
+    assert g01['D1C'].tolist() == [-1234.567, -0.125, -1234.0]
+    assert g01['S1C'].tolist() == [45.0, 44.5, 44.0]
+
+    r05 = load(files['R05'])
+    # во второй эпохе R05 не наблюдался, но был выше горизонта
+    assert r05['hour'].tolist() == [0, 30, 60]
+    assert r05['C1C'].tolist() == [21000000.5, 0, 21000100.25]
+    assert r05['L1C'].tolist() == [112000000.75, 0, 0]
+
+
+def test_satellite_first_seen_later(files):
+    # эпохи до первого наблюдения дописываются с нулевыми сигналами
+    g03 = load(files['G03'])
+    assert g03['hour'].tolist() == [0, 30, 60]
+    assert g03['el'] == pytest.approx([23, 23.5, 24])
+    assert g03['C1C'].tolist() == [0, 22000000.0, 22000001.5]
+    assert 'L1C' not in g03
+
+
+def test_block_size_does_not_change_output(parser, tmp_path):
+    expected = convert(parser, tmp_path / 'single', 1024 * 1024)
+    for block_size in (40, 64, 150, 333):
+        files = convert(parser, tmp_path / f'blocks-{block_size}', block_size)
+        assert sorted(files) == sorted(expected)
+        for satellite, path in files.items():
+            assert Path(path).read_bytes() == Path(expected[satellite]).read_bytes(), (block_size, satellite)
+
+
+def test_format_fixed():
+    values = np.array([0, 0.0004, -0.0004, -0.125, 45, -1234.567, 123456789.125])
+    chars = _format_fixed(values, 16, 3)
+    assert [row.tobytes().decode() for row in chars] == [
+        '           0.000',
+        '           0.000',
+        '           0.000',
+        '          -0.125',
+        '          45.000',
+        '       -1234.567',
+        '   123456789.125',
+    ]
+    with pytest.raises(ValueError):
+        _format_fixed(np.array([-1e12]), 16, 3)
@@ -0,0 +1,27 @@
+import shutil
+from pathlib import Path
+
+from parsers.satellite_parser import SatelliteParser
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'holes'
+
+
+def test_cache_is_not_reused_after_change_during_parse(tmp_path, monkeypatch):
+    path = str(shutil.copy(FIXTURES / 'test_G01.dat', tmp_path))
+    original = SatelliteParser._SatelliteParser__read_data
+
+    def read_and_append(self, f, mm):
+        data = original(self, f, mm)
+        # файл дописывают, пока разбирается его прежнее содержимое
+        with open(path, 'a') as appended:
+            appended.write(' '.join(['1440.000000'] * data.shape[1]) + '\n')
+        return data
+
+    monkeypatch.setattr(SatelliteParser, '_SatelliteParser__read_data', read_and_append)
+    rows = len(SatelliteParser.load(path).get_data())
+    monkeypatch.undo()
+
+    # кэш сохранен с ключом прежнего файла, новое содержимое разбирается заново
+    satellite = SatelliteParser.load(path)
+    assert len(satellite.get_data()) == rows + 1
+    assert satellite.get_data()[-1, 0] == 1440
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import random
+import tempfile
+import uuid
+
+import httpx
+
+from config import (
+    UPSTREAM_TIMEOUTS,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_RETRIES,
+    UPSTREAM_BACKOFF,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPLOAD_CHUNK_SIZE,
+    logger,
+)
+from metrics import count_bytes, timed
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Ответы, при которых сервис точно не начинал обработку запроса
+REJECT_STATUS_CODES = {429, 503}
+# Ошибки до отправки запроса: соединение не установлено
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class UpstreamClient:
+    """Общий асинхронный клиент сервиса конвертации с пулом соединений."""
+
+    def __init__(
+        self,
+        timeouts: dict = UPSTREAM_TIMEOUTS,
+        retries: int = UPSTREAM_RETRIES,
+        backoff: float = UPSTREAM_BACKOFF,
+    ):
+        self.timeouts = timeouts
+        self.retries = retries
+        self.backoff = backoff
+        self.__client = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        if self.__client is None or self.__client.is_closed:
+            logger.debug(f"Opening upstream HTTP client with {UPSTREAM_MAX_CONNECTIONS} connections")
+            self.__client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS,
+                ),
+                follow_redirects=True,
+            )
+        return self.__client
+
+    async def close(self):
+        if self.__client is not None:
+            await self.__client.aclose()
+            self.__client = None
+
+    def get_timeout(self, stage: str) -> httpx.Timeout:
+        return httpx.Timeout(self.timeouts[stage], connect=UPSTREAM_CONNECT_TIMEOUT)
+
+    async def request(self, method: str, url: str, stage: str, idempotent: bool = True, **kwargs) -> httpx.Response:
+        # неидемпотентный запрос повторяется, только если сервис его не получил или отклонил
+        async def send():
+            response = await self.get_client().request(method, url, timeout=self.get_timeout(stage), **kwargs)
+            self.__check_status(response)
+            return response
+
+        return await self.__retry(stage, url, send, idempotent)
+
+    async def upload(self, url: str, path: str, stage: str, field: str = "rinex", cookies: dict = None):
+        logger.info(f"Sending file {path} to {url}")
+
+        async def send():
+            # тело собирается заново на каждой попытке, чтобы файл читался с начала
+            boundary = uuid.uuid4().hex
+            head, tail = self.__get_multipart_envelope(boundary, field, os.path.basename(path))
+            headers = {
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Content-Length": str(len(head) + os.path.getsize(path) + len(tail)),
+            }
+            response = await self.get_client().post(
+                url,
+                content=self.__read_multipart(path, head, tail),
+                headers=headers,
+                cookies=cookies,
+                timeout=self.get_timeout(stage),
+            )
+            self.__check_status(response)
+            return response
+
+        response = await self.__retry(stage, url, send)
+        count_bytes('upstream_upload', os.path.getsize(path))
+        logger.info(f"File sent successfully to {url}")
+        return response
+
+    @staticmethod
+    def __get_multipart_envelope(boundary: str, field: str, filename: str) -> tuple[bytes, bytes]:
+        filename = filename.replace('"', '%22')
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        )
+        return head.encode(), f'\r\n--{boundary}--\r\n'.encode()
+
+    @staticmethod
+    async def __read_multipart(path: str, head: bytes, tail: bytes):
+        # файл читается в потоке, цикл событий не блокируется на больших загрузках
+        yield head
+        with open(path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+                yield chunk
+        yield tail
+
+    async def download(self, url: str, save_path: str, stage: str, cookies: dict = None):
+        logger.info(f"Downloading {url} to {save_path}")
+        # у каждой загрузки свой временный файл, одновременные загрузки не пересекаются
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(save_path) or None, prefix=os.path.basename(save_path), suffix=".tmp"
+        )
+        os.close(fd)
+
+        async def receive():
+            async with self.get_client().stream(
+                "GET", url, cookies=cookies, timeout=self.get_timeout(stage)
+            ) as response:
+                self.__check_status(response)
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(UPLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        count_bytes('upstream_download', len(chunk))
+            os.replace(tmp_path, save_path)
+            return save_path
+
+        try:
+            return await self.__retry(stage, url, receive)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def __retry(self, stage: str, url: str, send, idempotent: bool = True):
+        # время вызова вместе с повторами, этап сервиса в имени: upstream_upload, upstream_run
+        with timed(f"upstream_{stage}"):
+            return await self.__send(stage, url, send, idempotent)
+
+    async def __send(self, stage: str, url: str, send, idempotent: bool):
+        for attempt in range(self.retries + 1):
+            try:
+                return await send()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if not self.__is_retryable(e, idempotent) or attempt == self.retries:
+                    logger.error(f"Upstream {stage} request to {url} failed: {e!r}")
+                    raise
+                delay = self.__get_delay(attempt, e)
+                logger.warning(
+                    f"Upstream {stage} request to {url} failed: {e!r}. "
+                    f"Retry {attempt + 1}/{self.retries} in {delay:.2f} s"
+                )
+                await asyncio.sleep(delay)
+
+    def __get_delay(self, attempt: int, error: Exception) -> float:
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = error.response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return float(retry_after)
+        # экспоненциальная задержка с полным джиттером
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def __is_retryable(error: Exception, idempotent: bool) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            codes = RETRY_STATUS_CODES if idempotent else REJECT_STATUS_CODES
+            return error.response.status_code in codes
+        # после таймаута чтения или обрыва ответа сервис мог уже выполнить запрос
+        return idempotent or isinstance(error, CONNECT_ERRORS)
+
+    @staticmethod
+    def __check_status(response: httpx.Response):
+        if response.status_code != 200:
+            logger.error(f"Upstream responded to {response.url} with status code: {response.status_code}")
+            response.raise_for_status()
+
+
+upstream_client = UpstreamClient()
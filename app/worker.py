@@ -0,0 +1,145 @@
+from fastapi import HTTPException
+
+from config import (
+    WORKER_CONCURRENCY,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF,
+    JOB_POLL_INTERVAL,
+    WORKER_METRICS_PORT,
+    logger,
+    redis_async_client,
+)
+from functions import process_task
+from job_queue import job_queue
+from metrics import TASKS_IN_FLIGHT, start_metrics_server
+from parsers.parser_manager import parser_manager
+from task_store import task_store, TaskStatus
+from upstream_client import upstream_client
+
+import asyncio
+import signal
+
+class Worker:
+    """Отдельный процесс, выполняющий задачи конвертации из очереди.
+
+    Одновременно выполняется не больше concurrency задач. Парсер задачи
+    восстанавливается из метаданных реестра, поэтому загруженные файлы
+    должны лежать на общем с API томе.
+    """
+
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.slots = asyncio.Semaphore(concurrency)
+        self.jobs: set[asyncio.Task] = set()
+        self.stopping = asyncio.Event()
+
+    async def run(self):
+        logger.info(f"Worker started with concurrency {self.concurrency}")
+        requeue = asyncio.create_task(self.__requeue_expired())
+        try:
+            while not self.stopping.is_set():
+                await self.slots.acquire()
+                try:
+                    claimed = await job_queue.claim()
+                except Exception as e:
+                    logger.error(f"Failed to claim a job: {e}")
+                    claimed = None
+
+                if claimed is None:
+                    self.slots.release()
+                    await self.__sleep(JOB_POLL_INTERVAL)
+                    continue
+
+                job = asyncio.create_task(self.__handle(*claimed))
+                self.jobs.add(job)
+                job.add_done_callback(self.__finish)
+        finally:
+            requeue.cancel()
+            if self.jobs:
+                logger.info(f"Waiting for {len(self.jobs)} running jobs")
+                await asyncio.gather(*self.jobs, return_exceptions=True)
+            logger.info("Worker stopped")
+
+    def stop(self):
+        logger.info("Worker is stopping, no new jobs will be claimed")
+        self.stopping.set()
+
+    def __finish(self, job: asyncio.Task):
+        self.jobs.discard(job)
+        self.slots.release()
+
+    async def __handle(self, task_id: str, attempts: int):
+        logger.info(f"Job {task_id} claimed, attempt {attempts}/{JOB_MAX_ATTEMPTS}")
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self.__extend_lease(task_id, attempts, asyncio.current_task(), lease_lost))
+        try:
+            if attempts > JOB_MAX_ATTEMPTS:
+                # аренда истекала слишком много раз: воркеры падают на этой задаче
+                raise RuntimeError("Job lease expired too many times")
+            parser = await parser_manager.get_parser(task_id)
+            with TASKS_IN_FLIGHT.track_inprogress():
+                await process_task(parser, task_id)
+        except asyncio.CancelledError:
+            if not lease_lost.is_set():
+                raise
+            # задачу уже выполняет другой воркер, ее состояние больше не трогаем
+            logger.warning(f"Job {task_id} was cancelled after its lease was lost")
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            if attempts < JOB_MAX_ATTEMPTS and not isinstance(e, HTTPException):
+                if await job_queue.retry(task_id, attempts, JOB_RETRY_BACKOFF * 2 ** (attempts - 1), error):
+                    await task_store.update(task_id, TaskStatus.PROCESSING, stage='retrying', error=error)
+            elif await job_queue.dead_letter(task_id, attempts, error):
+                await task_store.update(task_id, TaskStatus.FAILED, error=error)
+        else:
+            if not await job_queue.ack(task_id, attempts):
+                logger.warning(f"Job {task_id} finished after its lease was lost")
+        finally:
+            heartbeat.cancel()
+
+    async def __extend_lease(self, task_id: str, attempts: int, job: asyncio.Task, lease_lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(job_queue.visibility_timeout / 3)
+            try:
+                extended = await job_queue.extend(task_id, attempts)
+            except Exception as e:
+                logger.warning(f"Failed to extend lease of job {task_id}: {e}")
+                continue
+            if not extended:
+                # аренда истекла и задача могла уйти другому воркеру: выполнение прерывается,
+                # чтобы задача не выполнялась дважды
+                logger.warning(f"Lease of job {task_id} was lost, cancelling it")
+                lease_lost.set()
+                job.cancel()
+                return
+
+    async def __requeue_expired(self):
+        while True:
+            try:
+                await job_queue.requeue_expired()
+            except Exception as e:
+                logger.warning(f"Failed to requeue expired jobs: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def __sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main():
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT)
+    worker = Worker()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await upstream_client.close()
+        await redis_async_client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())